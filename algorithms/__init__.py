@@ -0,0 +1,22 @@
+import elephantfish
+from algorithms import elephantfish_pvs, elephantfish_alphabeta
+
+################################################################################
+# The search strategies, by name. They all search the same board with the same
+# move generation, evaluation and table, which live in elephantfish.py, and
+# only differ in the search itself.
+################################################################################
+
+STRATEGIES = {
+    'mtd-bi': elephantfish.Searcher,
+    'pvs': elephantfish_pvs.Searcher,
+    'alphabeta': elephantfish_alphabeta.Searcher,
+}
+DEFAULT = 'mtd-bi'
+
+def searcher(name=DEFAULT, **kwargs):
+    """ A new Searcher of the strategy name, kwargs going to its constructor """
+    if name not in STRATEGIES:
+        raise ValueError('Unknown search strategy {!r}, expected one of {}'.format(
+            name, ', '.join(sorted(STRATEGIES))))
+    return STRATEGIES[name](**kwargs)
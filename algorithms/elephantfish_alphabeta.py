@@ -0,0 +1,14 @@
+#!/usr/bin/env pypy
+# -*- coding: utf-8 -*-
+
+from algorithms import elephantfish_pvs
+
+###############################################################################
+# Fail-soft alpha-beta on the elephantfish core: the search of
+# elephantfish_pvs, with the window of the node for every move and without
+# internal iterative deepening.
+###############################################################################
+
+class Searcher(elephantfish_pvs.Searcher):
+    NULL_WINDOWS = False
+    IID_DEPTH = None
@@ -2,11 +2,13 @@ import json
 import time
 import re
 import os # Import os for path manipulation
+import threading
 from flask import Flask, request, jsonify, send_from_directory # Import send_from_directory
 from flask_cors import CORS # Import CORS
 
 # Assuming elephantfish.py is in the same directory or accessible in PYTHONPATH
 import elephantfish
+import algorithms
 
 # Define the path to the 'ui' directory relative to this app.py file
 # This assumes app.py is in the project root, and 'ui' is a subdirectory.
@@ -30,12 +32,67 @@ def convert_board_to_frontend_format(board_string_256):
 
 # --- Game state and AI Searcher (Global for simplicity in this example) ---
 # In a production app, you might manage state differently (e.g., per session, or a more robust global store)
-hist = [elephantfish.Position(elephantfish.initial, 0)]
-searcher = elephantfish.Searcher()
+hist = [elephantfish.make_position(elephantfish.initial, 0)]
+# The search strategy, by its name in algorithms.STRATEGIES
+AI_STRATEGY = os.environ.get('ELEPHANTFISH_STRATEGY', algorithms.DEFAULT)
+searcher = algorithms.searcher(AI_STRATEGY)
+# Lazy SMP: the AI searches with one process per core, unless told otherwise
+AI_THREADS = int(os.environ.get('ELEPHANTFISH_THREADS', os.cpu_count() or 1))
+# On a ponder hit, the search goes on until it has had THINK_TIME in all, so
+# the reply comes at once if the player took longer than that. With False it
+# gets THINK_TIME more after the move arrives instead, and goes deeper.
+PONDER_INSTANT = True
+
+# --- Pondering: searching on the player's time ---
+class Ponder(object):
+    """ A search, in a background thread, of the position after the reply we
+    expect from the player, made while they think about it. The searcher is
+    the shared one, so nothing else may search until it is finished. """
+    def __init__(self, pos, history, expected):
+        self.expected = expected
+        self.pos = pos.move(expected)
+        self.history = history + [self.pos]
+        self.stop = threading.Event()
+        self.result = None
+        self.start = time.time()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        for result in searcher.search(self.pos, self.history, threads=AI_THREADS, stop=self.stop):
+            self.result = result
+
+    def cancel(self):
+        """ Stops the search, which notices within a few milliseconds """
+        self.stop.set()
+        self.thread.join()
+
+    def finish(self, deadline):
+        """ On a hit: lets the search go on until deadline, and returns its
+            last completed depth as (depth, move, score, stats) """
+        self.thread.join(max(0, deadline - time.time()))
+        self.cancel()
+        return self.result
+
+ponder = None
+
+def stop_pondering():
+    global ponder
+    if ponder is not None:
+        ponder.cancel()
+        ponder = None
+
+def start_pondering():
+    """ Bets on the player's reply being the one in our principal variation,
+        and starts searching the position after it """
+    global ponder
+    expected = searcher.tp.get_move(hist[-1].key)
+    if expected is not None and expected in hist[-1].legal_moves():
+        ponder = Ponder(hist[-1], hist, expected)
 
 # --- Core game logic function (adapted from ui-server.py's process_move) ---
 def process_player_move(player_move_str):
-    global hist, searcher
+    global hist, searcher, ponder
 
     # elephantfish.print_pos(hist[-1]) # Log current position before player's move
 
@@ -48,19 +105,23 @@ def process_player_move(player_move_str):
     if not match:
         return jsonify({'error': "Please enter a move like h2e2", 'board': convert_board_to_frontend_format(hist[-1].board), 'score': hist[-1].score, 'canUndoAgain': len(hist) > 2}), 400
     
-    parsed_move = elephantfish.parse(match.group(1)), elephantfish.parse(match.group(2))
+    parsed_move = elephantfish.make_move(elephantfish.parse(match.group(1)), elephantfish.parse(match.group(2)))
     
     player_pos = hist[-1] # Current position, player (Red) to move
-    if parsed_move not in player_pos.gen_moves():
+    if parsed_move not in player_pos.legal_moves():
         return jsonify({'error': "Invalid move", 'board': convert_board_to_frontend_format(player_pos.board), 'score': player_pos.score, 'canUndoAgain': len(hist) > 2}), 400
 
     print(f"Key log: Player move '{player_move_str}' is valid")
+    if ponder is not None and ponder.expected != parsed_move:
+        print("Key log: Ponder miss")
+        stop_pondering()
     hist.append(player_pos.move(parsed_move)) # Apply player's move. New hist[-1] is AI's (Black's) turn.
     # elephantfish.print_pos(hist[-1]) # Log position after player's move (AI's perspective)
 
     # Check if player's move resulted in a win for the player (checkmate against AI)
     # hist[-1].score is from AI's (Black's) perspective.
     if hist[-1].score <= -elephantfish.MATE_UPPER:
+        stop_pondering()
         current_board_state = convert_board_to_frontend_format(hist[-1].rotate().board) # Rotate back for player's view of final board
         return jsonify({
             'message': "You won! (AI is checkmated)", 
@@ -75,33 +136,46 @@ def process_player_move(player_move_str):
     # AI's turn
     ai_pos = hist[-1] # AI (Black) to move
     start_time = time.time()
-    ai_move_tuple = None
+    ai_move = None
     final_ai_score_from_search = 0 # From AI's perspective, initialize to a non-mate score
 
-    for _depth, current_ai_move_tuple, current_ai_score in searcher.search(ai_pos, hist):
-        ai_move_tuple = current_ai_move_tuple
-        final_ai_score_from_search = current_ai_score # Capture the score from search
-        if time.time() - start_time > elephantfish.THINK_TIME:
-            print(f"AI think time limit reached at depth {_depth}")
-            break
+    # On a ponder hit, the pondering search is already searching this very position
+    result = None
+    if ponder is not None:
+        deadline = (ponder.start if PONDER_INSTANT else start_time) + elephantfish.THINK_TIME
+        result = ponder.finish(deadline)
+        ponder = None
+        print(f"Key log: Ponder hit, searched to depth {result and result[0]}")
+    if result is not None and result[1] is not None:
+        _depth, ai_move, final_ai_score_from_search, _stats = result
+    else:
+        # The time manager only starts depths that should finish within THINK_TIME
+        # (more if the best move keeps changing) and cuts the search off at a hard
+        # deadline. The last completed depth gives the move.
+        timer = elephantfish.TimeManager(elephantfish.THINK_TIME)
+        for _depth, current_ai_move, current_ai_score, _stats in timer.search(searcher, ai_pos, hist, threads=AI_THREADS):
+            ai_move = current_ai_move
+            final_ai_score_from_search = current_ai_score # Capture the score from search
+    print(f"AI search done at depth {_depth} in {time.time() - start_time:.2f}s")
     
-    if ai_move_tuple is None:
+    if ai_move is None:
         # This case means AI has no moves. Could be checkmated by player or stalemated.
         # We'll rely on the player win condition check after player's move for checkmate detection by player.
         # For now, if search returns no move, treat as an error or potential stalemate (not fully handled here yet).
         return jsonify({'error': "AI Error: No move found or AI is stalemated/checkmated (player might have won)", 'board': convert_board_to_frontend_format(ai_pos.rotate().board), 'score': -ai_pos.score, 'canUndoAgain': len(hist) > 2}), 500
 
-    # ai_move_tuple contains (from_sq_AI_pov, to_sq_AI_pov) which are indices on the AI's rotated board.
+    # ai_move is from_sq_AI_pov << 8 | to_sq_AI_pov, indices on the AI's rotated board.
     # We need to convert these to absolute board indices (Red's POV, standard board) before rendering.
     # The rotation effect is: rotated_board[k] corresponds to original_board[254-k].
-    from_sq_absolute = 254 - ai_move_tuple[0]
-    to_sq_absolute = 254 - ai_move_tuple[1]
+    absolute_move = elephantfish.flip_move(ai_move)
+    from_sq_absolute = absolute_move >> 8
+    to_sq_absolute = absolute_move & 255
 
     ai_move_str = elephantfish.render(from_sq_absolute) + elephantfish.render(to_sq_absolute)
-    # Original line: ai_move_str = elephantfish.render(ai_move_tuple[0]) + elephantfish.render(ai_move_tuple[1])
-    print(f"Key log: AI move (rotated POV): {elephantfish.render(ai_move_tuple[0]) + elephantfish.render(ai_move_tuple[1])}, AI move (absolute POV): {ai_move_str}")
+    # Original line: ai_move_str = elephantfish.render(ai_move >> 8) + elephantfish.render(ai_move & 255)
+    print(f"Key log: AI move (rotated POV): {elephantfish.render(ai_move >> 8) + elephantfish.render(ai_move & 255)}, AI move (absolute POV): {ai_move_str}")
     
-    hist.append(ai_pos.move(ai_move_tuple)) # Apply AI's move. New hist[-1] is Player's (Red's) turn.
+    hist.append(ai_pos.move(ai_move)) # Apply AI's move. New hist[-1] is Player's (Red's) turn.
     # elephantfish.print_pos(hist[-1]) # Log position after AI's move (Player's perspective)
 
     # Check if AI's move resulted in a win for AI (checkmate against player)
@@ -130,6 +204,9 @@ def process_player_move(player_move_str):
     }
     if winner_status:
         response_data['winner'] = winner_status
+    else:
+        # Think on the player's time
+        start_pondering()
     
     return jsonify(response_data), 200
 
@@ -140,9 +217,10 @@ def game_page():
 
 @app.route('/new_game', methods=['POST', 'GET']) # Allow GET for easy browser testing too
 def new_game():
-    global hist, searcher
-    hist = [elephantfish.Position(elephantfish.initial, 0)]
-    searcher = elephantfish.Searcher() # Re-initialize searcher if it has internal state like transposition tables
+    global hist
+    stop_pondering()
+    hist = [elephantfish.make_position(elephantfish.initial, 0)]
+    # The searcher is kept: its transposition table stays valid across games
     print("Key log: New game started.")
     
     initial_pos = hist[0]
@@ -174,6 +252,7 @@ def handle_undo():
     print("Key log: Received /undo request")
 
     if len(hist) > 2: # Need at least initial + 1 player move + 1 AI move to undo a pair
+        stop_pondering() # It was thinking about a position that is gone now
         hist.pop()  # Remove AI's last move state
         hist.pop()  # Remove Player's last move state
         
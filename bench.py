@@ -0,0 +1,277 @@
+#!/usr/bin/env pypy
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+import os
+import sys
+import gc
+import json
+import time
+import random
+import socket
+import platform
+import argparse
+import multiprocessing
+
+import elephantfish
+import perft
+import tools
+
+################################################################################
+# Micro-benchmarks: each part of the engine is timed on its own, over a fixed
+# set of positions, so a slowdown shows up in the component that caused it
+# rather than only in the overall node rate.
+#
+# Results can be saved as JSON, together with a description of the machine,
+# and later runs compared against them. Every kernel is run a few times and
+# the spread of those runs, leaving out the fastest and the slowest when there
+# are five or more, is taken as its noise: a change only counts as a
+# regression when it is larger than both the threshold and the noise.
+################################################################################
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data/bench.json')
+OPENINGS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data/fen/random_openings.fen')
+
+# Positions: the perft reference suite and a fixed sample of openings
+OPENINGS_SAMPLE = 20
+# Depth of the bound() kernel, and the table size of its searchers
+BOUND_DEPTH = 3
+BENCH_TABLE_MB = 4
+# Each kernel is repeated until a run lasts at least MIN_TIME seconds
+REPEAT = 5
+MIN_TIME = 0.2
+# Slowdowns below THRESHOLD, or within NOISE_FACTOR times the noise, are ignored
+THRESHOLD = 0.05
+NOISE_FACTOR = 2
+
+timer = getattr(time, 'perf_counter', time.time)
+
+def load_fens():
+    fens = [fen for fen, _ in perft.read_reference()]
+    with open(OPENINGS) as f:
+        fens += random.Random(0).sample([line.strip() for line in f if line.strip()], OPENINGS_SAMPLE)
+    return fens
+
+################################################################################
+# Kernels
+#
+# A kernel takes the list of FENs, does its setup, and returns a function
+# which runs the timed work once and returns how many operations it did.
+################################################################################
+
+def positions(fens):
+    return [tools.parseFEN(fen) for fen in fens]
+
+def moves(fens):
+    return [(pos, move) for pos in positions(fens) for move in pos.gen_moves()]
+
+def gen_moves_kernel(fens):
+    poss = positions(fens)
+    def run():
+        return sum(len(list(pos.gen_moves())) for pos in poss)
+    return run
+
+def move_kernel(fens):
+    pairs = moves(fens)
+    def run():
+        for pos, move in pairs:
+            pos.move(move)
+        return len(pairs)
+    return run
+
+def rotate_kernel(fens):
+    poss = positions(fens)
+    def run():
+        for pos in poss:
+            pos.rotate()
+        return len(poss)
+    return run
+
+def value_kernel(fens):
+    pairs = moves(fens)
+    def run():
+        for pos, move in pairs:
+            pos.value(move)
+        return len(pairs)
+    return run
+
+def parse_fen_kernel(fens):
+    def run():
+        for fen in fens:
+            tools.parseFEN(fen)
+        return len(fens)
+    return run
+
+def search_kernel(fens, depth):
+    ''' bound() at every depth up to depth from an empty table, counted in
+        nodes. Clearing the table isn't timed. '''
+    poss = positions(fens)
+    tp = elephantfish.TranspositionTable(BENCH_TABLE_MB)
+    def run():
+        nodes, run.elapsed = 0, 0
+        for pos in poss:
+            tp.clear()
+            searcher = elephantfish.Searcher(tp=tp)
+            board = elephantfish.Board(pos)
+            start = timer()
+            for d in range(min(depth, 1), depth + 1):
+                searcher.bound(board, pos.score, d)
+            run.elapsed += timer() - start
+            nodes += searcher.nodes
+        return nodes
+    return run
+
+def qsearch_kernel(fens):
+    return search_kernel(fens, 0)
+
+def bound_kernel(fens):
+    return search_kernel(fens, BOUND_DEPTH)
+
+KERNELS = [
+    ('gen_moves', gen_moves_kernel),
+    ('move', move_kernel),
+    ('rotate', rotate_kernel),
+    ('value', value_kernel),
+    ('parseFEN', parse_fen_kernel),
+    ('qsearch', qsearch_kernel),
+    ('bound', bound_kernel),
+]
+
+################################################################################
+# Running and comparing
+################################################################################
+
+def measure(run):
+    ''' Seconds and operations of one call of run. A kernel that sets up inside
+        the call leaves the time of the work proper in run.elapsed. '''
+    run.elapsed = None
+    start = timer()
+    ops = run()
+    secs = timer() - start
+    return (secs if run.elapsed is None else run.elapsed), ops
+
+def time_kernel(make, fens, repeat=REPEAT, min_time=MIN_TIME):
+    ''' Times a kernel repeat times, as {'ops', 'loops', 'runs', 'best',
+        'median', 'noise'} where runs are in seconds per operation and noise is
+        the relative spread of the middle runs around the median. '''
+    run = make(fens)
+    secs, ops = measure(run)
+    loops = max(1, int(min_time / max(secs, 1e-9) + .5))
+    runs = []
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            total, total_ops = 0, 0
+            for _ in range(loops):
+                secs, ops = measure(run)
+                total += secs
+                total_ops += ops
+            runs.append(total / max(total_ops, 1))
+    finally:
+        if enabled:
+            gc.enable()
+    runs.sort()
+    median = runs[len(runs) // 2]
+    return {
+        'ops': ops,
+        'loops': loops,
+        'runs': runs,
+        'best': runs[0],
+        'median': median,
+        'noise': (runs[-2] - runs[1] if len(runs) > 4 else runs[-1] - runs[0]) / median,
+    }
+
+def machine():
+    return {
+        'implementation': platform.python_implementation(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpus': multiprocessing.cpu_count(),
+        'host': socket.gethostname(),
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+def run_benchmarks(names=None, repeat=REPEAT, min_time=MIN_TIME, verbose=True):
+    ''' Times the kernels in names, or all of them, as {'machine', 'kernels'} '''
+    fens = load_fens()
+    results = {}
+    for name, make in KERNELS:
+        if names and name not in names:
+            continue
+        results[name] = res = time_kernel(make, fens, repeat, min_time)
+        if verbose:
+            print('{:10} {:>12,.0f} op/s  (best {:,.0f} op/s, noise {:.1%})'.format(
+                name, 1 / res['median'], 1 / res['best'], res['noise']), flush=True)
+    return {'machine': machine(), 'kernels': results}
+
+def save(results, path=BASELINE):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+def load(path=BASELINE):
+    with open(path) as f:
+        return json.load(f)
+
+def compare(results, baseline, threshold=THRESHOLD, verbose=True):
+    ''' The names of the kernels that got slower than the baseline. A kernel
+        is slower when its median speed went down by more than the threshold
+        and by more than NOISE_FACTOR times the noise of the two runs. '''
+    if verbose:
+        for k in ('implementation', 'python', 'machine', 'processor', 'host'):
+            old, new = baseline['machine'].get(k), results['machine'].get(k)
+            if old != new:
+                print('Warning: {} differs from the baseline: {} rather than {}'.format(k, new, old))
+    regressions = []
+    for name, res in sorted(results['kernels'].items()):
+        base = baseline['kernels'].get(name)
+        if base is None:
+            continue
+        speedup = base['median'] / res['median'] - 1
+        tolerance = max(threshold, NOISE_FACTOR * (res['noise'] + base['noise']))
+        if speedup < -tolerance:
+            verdict = 'SLOWER'
+            regressions.append(name)
+        elif speedup > tolerance:
+            verdict = 'faster'
+        else:
+            verdict = ''
+        if verbose:
+            print('{:10} {:>+7.1%}  (tolerance {:.1%})  {}'.format(name, speedup, tolerance, verdict))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmarks for elephantfish')
+    parser.add_argument('kernels', nargs='*', help='kernels to run, of ' + ', '.join(name for name, _ in KERNELS))
+    parser.add_argument('--save', nargs='?', const=BASELINE, help='save the results as a baseline')
+    parser.add_argument('--compare', nargs='?', const=BASELINE, help='compare with a saved baseline')
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--min-time', type=float, default=MIN_TIME, help='seconds per timed run')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help='relative slowdown to report')
+    args = parser.parse_args()
+    unknown = set(args.kernels) - set(name for name, _ in KERNELS)
+    if unknown:
+        parser.error('unknown kernels: ' + ', '.join(sorted(unknown)))
+    results = run_benchmarks(args.kernels, args.repeat, args.min_time)
+    if args.save:
+        save(results, args.save)
+    if args.compare:
+        print()
+        regressions = compare(results, load(args.compare), args.threshold)
+        if regressions:
+            print('Regressions: ' + ', '.join(regressions))
+            sys.exit(1)
+
+# Old Python compatability
+if sys.version_info < (3,5):
+    old_print = print
+    def print(*args, **kwargs):
+        flush = kwargs.pop('flush', False)
+        old_print(*args, **kwargs)
+        if flush:
+            kwargs.get('file', sys.stdout).flush()
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,21 @@
 #!/usr/bin/env pypy
 # -*- coding: utf-8 -*-
 
-from __future__ import print_function
-import re, sys, time
-from itertools import count
-from collections import namedtuple
+from __future__ import print_function, division
+import re, sys, time, json, random, copy
+import multiprocessing
+from array import array
+from bisect import insort
+from collections import namedtuple, Counter
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python < 3.8: no shared table, so no parallel search
+    shared_memory = None
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:
+    ProcessPoolExecutor = None
 
 piece = { 'P': 44, 'N': 108, 'B': 23, 'R': 233, 'A': 23, 'C': 101, 'K': 2500}
 
@@ -128,6 +139,25 @@ initial = (
     '               \n'  # 110 -119
 )
 
+# Zobrist keys. Every black key is the red key of the mirrored square with its
+# two 32 bit halves swapped, so rotating the board just swaps the halves of the
+# position key. Seeded so that keys agree across processes and runs.
+MASK32 = (1 << 32) - 1
+swap_halves = lambda key: (key >> 32) | (key & MASK32) << 32
+zobrist_rng = random.Random(0)
+zobrist = {}
+for p in 'PNBRACK':
+    zobrist[p] = [zobrist_rng.getrandbits(64) for _ in range(256)]
+    zobrist[p.lower()] = [swap_halves(zobrist[p][254 - i]) for i in range(256)]
+
+def zhash(board):
+    ''' Computes the Zobrist key of a board from scratch '''
+    key = 0
+    for i, p in enumerate(board):
+        if p in zobrist:
+            key ^= zobrist[p][i]
+    return key
+
 # Lists of possible moves for each piece type.
 N, E, S, W = -16, 1, 16, -1
 directions = {
@@ -140,103 +170,481 @@ directions = {
     'K': (N, E, S, W)
 }
 
+# Precomputed moves of the short range pieces, built once at import. For every
+# square, step_moves[p][i] lists the targets of a king, advisor or pawn with
+# the palace and river rules already applied, and (target, blocking square)
+# pairs for knights (the leg) and elephants (the eye). Move generation then
+# only has to look at the blocking square and the target's occupant.
+inside = lambda i: 0 <= i < 256 and not initial[i].isspace()
+in_palace = lambda i: inside(i) and i >= 160 and 6 <= i & 15 <= 8
+def knight_leg(i, j):
+    n_diff_x = (j - i) & 15
+    if n_diff_x == 14 or n_diff_x == 2:
+        return i + (1 if n_diff_x == 2 else -1)
+    return i + 16 if j > i else i - 16
+step_moves = {p: [() for _ in range(256)] for p in 'PNBAK'}
+for i in filter(inside, range(256)):
+    # 过河的卒/兵才能横着走
+    step_moves['P'][i] = tuple(i+d for d in directions['P'] if inside(i+d) and (d == N or i < 128))
+    step_moves['N'][i] = tuple((i+d, knight_leg(i, i+d)) for d in directions['N'] if inside(i+d))
+    step_moves['B'][i] = tuple((i+d, i+d//2) for d in directions['B'] if inside(i+d) and i+d >= 128)
+    step_moves['A'][i] = tuple(i+d for d in directions['A'] if in_palace(i+d))
+    step_moves['K'][i] = tuple(i+d for d in directions['K'] if in_palace(i+d))
+
+# The same tables looked at from the target: knight_attacks[i] lists the
+# (knight square, leg) pairs of knights that could jump to i, and knight_legs[i]
+# the squares whose occupants can block such a jump.
+knight_attacks = [[] for _ in range(256)]
+for i in range(256):
+    for j, b in step_moves['N'][i]:
+        knight_attacks[j].append((i, b))
+knight_legs = [frozenset(b for _, b in knight_attacks[i]) for i in range(256)]
+
 MATE_LOWER = piece['K'] - (2*piece['R'] + 2*piece['N'] + 2*piece['B'] + 2*piece['A'] + 2*piece['C'] + 5*piece['P'])
 MATE_UPPER = piece['K'] + (2*piece['R'] + 2*piece['N'] + 2*piece['B'] + 2*piece['A'] + 2*piece['C'] + 5*piece['P'])
 
-# The table size is the maximum number of elements in the transposition table.
-TABLE_SIZE = 1e7
+# The memory budget of the transposition table, in megabytes.
+TABLE_MB = 64
 
 # Constants for tuning search
-QS_LIMIT = 219
+QS_LIMIT = 80
 EVAL_ROUGHNESS = 13
 DRAW_TEST = True
 THINK_TIME = 5
+# History scores are halved whenever one of them grows past this
+HISTORY_MAX = 1 << 14
+
+# Selective search. Every technique has its own switch, and Searcher.pruning
+# counts how often each one fired, so their savings can be measured apart.
+NULL_MOVE = True
+LATE_MOVE_REDUCTION = True
+FUTILITY = True
+REVERSE_FUTILITY = True
+RAZORING = True
+# Null move: reduce by R plus one more from NULL_DEEP_DEPTH on, and verify
+# cutoffs with a search without null move once the side to move is down to
+# NULL_VERIFY_MAJORS rooks, knights and cannons, where zugzwang is likely.
+NULL_R = 2
+NULL_DEEP_DEPTH = 6
+NULL_VERIFY_MAJORS = 2
+# Quiet moves after the first LMR_MOVES are searched a ply shallower, or two
+# plies after LMR_MOVES_DEEP, and searched again in full if they fail high.
+LMR_DEPTH = 3
+LMR_MOVES = 3
+LMR_MOVES_DEEP = 12
+# Margins per ply of remaining depth for the shallow depth prunings
+FUTILITY_DEPTH, FUTILITY_MARGIN = 2, 60
+REVERSE_FUTILITY_DEPTH, REVERSE_FUTILITY_MARGIN = 3, 50
+RAZOR_DEPTH, RAZOR_MARGIN = 2, 150
+
+# The quiescence search tries captures worth at least QS_LIMIT, which with
+# the piece square values above means those of knights, cannons, rooks and
+# kings. Captures that lose material by static exchange (SEE) are left out of
+# it (counted as 'see' in Searcher.pruning), and come after the quiet moves
+# in the main search ('see_late'). Delta pruning leaves out the quiescence
+# captures that can't bring the score to within DELTA_MARGIN of gamma.
+SEE_PRUNING = True
+DELTA_PRUNING = True
+DELTA_MARGIN = 50
+
+# Aspiration: the score search at each depth starts from the score of the
+# previous depth and widens its steps by ASPIRATION_DELTA, doubling each time,
+# until the score is bracketed. Off, every depth bisects the full range.
+ASPIRATION = True
+ASPIRATION_DELTA = 20
+
+# How often, in nodes, the search checks its deadline, node budget and stop flag
+POLL_NODES = 1024
+
+# Count the search statistics of Searcher.stats inside the search. The per
+# depth figures are kept either way.
+STATS = True
+# Slots sampled for the table fill
+FILL_SAMPLE = 1000
 
 ###############################################################################
 # Chess logic
 ###############################################################################
 
-class Position(namedtuple('Position', 'board score')):
+# Moves are ints, from << 8 | to, the squares being indices into the board of
+# the side to move. The move buffers of the search are lists of scored moves,
+# sorted as plain ints: the move in the low 16 bits, its value + GAIN_BIAS in
+# bits 16-31, and the ordering key above, which for captures is made of the
+# captured piece and the capturing one (MVV-LVA). entry & MOVE_MASK is the move.
+MOVE_MASK = 0xffff
+GAIN_BIAS = 1 << 15
+
+def make_move(i, j):
+    return i << 8 | j
+
+def flip_move(move):
+    ''' The move as seen by the other side, (254 - i, 254 - j) '''
+    return 0xfefe - move
+
+# The squares a move may go to: empty ones for quiet moves, enemy pieces for
+# captures, indexed by (quiets, captures).
+targets = {(True, True): frozenset('.rnbakcp'), (True, False): frozenset('.'),
+           (False, True): frozenset('rnbakcp'), (False, False): frozenset()}
+
+def gen_moves(board, ours, king, quiets=True, captures=True):
+    """ Pseudo legal moves of the side to move (upper case) on a board given
+        as a string or a list of characters.
+    ours -- the squares of the pieces to move, in the order to visit them
+    king -- the square of the opposing king, for the flying general rule
+    quiets, captures -- which kinds of moves to generate
+    """
+    # For each of our pieces, iterate through each possible 'ray' of moves,
+    # as defined in the 'directions' map. The rays are broken e.g. by
+    # captures or immediately in case of pieces such as knights.
+    # Only the squares in the piece list are visited.
+    ok = targets[quiets, captures]
+    for i in ours:
+        p = board[i]
+        f = i << 8
+        if p == 'R' or p == 'C':
+            for d in directions[p]:
+                j = i + d
+                while board[j] == '.':
+                    if quiets: yield f | j
+                    j += d
+                if p == 'C' and not board[j].isspace():
+                    # Cannons capture by jumping exactly one screen
+                    j += d
+                    while board[j] == '.': j += d
+                if captures and board[j].islower(): yield f | j
+        elif p == 'N' or p == 'B':
+            for j, b in step_moves[p][i]:
+                if board[b] == '.' and board[j] in ok:
+                    yield f | j
+        else:
+            if p == 'K' and captures:
+                # The kings may never face each other on an open file, so
+                # "capturing" the other king that way is how we find it out.
+                if board[king] == 'k' and (i - king) & 15 == 0 and all(
+                        board[s] == '.' for s in range(i - 16, king, -16)):
+                    yield f | king
+            for j in step_moves[p][i]:
+                if board[j] in ok:
+                    yield f | j
+
+def mvv_lva(board, move):
+    """ Capture ordering key: most valuable victim first, then least
+        valuable attacker """
+    return piece[board[move & 255].upper()] * 4096 - piece[board[move >> 8]]
+
+def is_attacked(board, sq, lower=True):
+    """ Is square sq attacked by the lower case pieces, or by the upper case
+        ones if not lower? Looks outward from sq along the lines, knight jumps
+        and pawn steps that could reach it, rather than generating moves. """
+    R, N_, C, K, P = 'rnckp' if lower else 'RNCKP'
+    for d in directions['R']:
+        j = sq + d
+        while board[j] == '.': j += d
+        q = board[j]
+        if q == R: return True
+        if q == K:
+            # Flying general, or a king next to us inside its palace
+            if board[sq] == K.swapcase() and d == (N if lower else S): return True
+            if j == sq + d and in_palace(254 - sq if lower else sq): return True
+        if q.isspace(): continue
+        # The first piece is a screen for a cannon behind it
+        j += d
+        while board[j] == '.': j += d
+        if board[j] == C: return True
+    for k, b in knight_attacks[sq]:
+        if board[k] == N_ and board[b] == '.': return True
+    # Pawns come from the front, and from the sides once across the river
+    if lower:
+        if board[sq + N] == P or sq >= 128 and (board[sq + W] == P or board[sq + E] == P):
+            return True
+    elif board[sq + S] == P or sq < 128 and (board[sq + W] == P or board[sq + E] == P):
+        return True
+    return False
+
+def least_attacker(board, sq, lower=True):
+    """ The least valuable of the lower case pieces attacking square sq, or
+        of the upper case ones if not lower, as (value, square), or None. Like
+        is_attacked(), but it has to tell the attackers apart. """
+    R, N_, B, A, C, K, P = 'rnbackp' if lower else 'RNBACKP'
+    # Advisors and elephants, the cheapest, stay on their own side
+    own = in_palace(254 - sq if lower else sq)
+    if own:
+        for d in directions['A']:
+            if board[sq + d] == A: return piece['A'], sq + d
+    if (sq < 128) == lower:
+        for d in directions['B']:
+            if board[sq + d] == B and board[sq + d // 2] == '.': return piece['B'], sq + d
+    if lower:
+        pawns = (sq + N, sq + W, sq + E) if sq >= 128 else (sq + N,)
+    else:
+        pawns = (sq + S, sq + W, sq + E) if sq < 128 else (sq + S,)
+    for s in pawns:
+        if board[s] == P: return piece['P'], s
+    # Along the lines: rooks and kings in front, cannons behind one screen
+    rook = king = cannon = None
+    for d in directions['R']:
+        j = sq + d
+        while board[j] == '.': j += d
+        q = board[j]
+        if q == R: rook = j
+        elif q == K and j == sq + d and own: king = j
+        if q.isspace(): continue
+        j += d
+        while board[j] == '.': j += d
+        if board[j] == C: cannon = j
+    if cannon is not None: return piece['C'], cannon
+    for k, b in knight_attacks[sq]:
+        if board[k] == N_ and board[b] == '.': return piece['N'], k
+    if rook is not None: return piece['R'], rook
+    if king is not None: return piece['K'], king
+    return None
+
+def see(board, move):
+    """ Static exchange evaluation of a capture: the material it wins once
+        both sides have taken turns recapturing on the target square with
+        their least valuable attacker, each stopping when that pays. Every
+        capture is played out on a copy of the board, so pieces behind the
+        ones taken join in, cannons find new screens, and knight legs
+        open up. """
+    i, j = move >> 8, move & 255
+    board = list(board)
+    gains = [piece[board[j].upper()]]
+    on = piece[board[i]]
+    board[j], board[i] = board[i], '.'
+    lower = True
+    while True:
+        attacker = least_attacker(board, j, lower)
+        if attacker is None:
+            break
+        gains.append(on - gains[-1])
+        # Neither side will want to go on from here
+        if max(-gains[-2], gains[-1]) < 0:
+            break
+        on, s = attacker
+        board[j], board[s] = board[s], '.'
+        lower = not lower
+    while len(gains) > 1:
+        gain = gains.pop()
+        gains[-1] = -max(-gains[-1], gain)
+    return gains[0]
+
+def may_expose(i, j, king):
+    """ Could moving a piece (not the king) from i to j expose our king on
+        square king? Only if the piece leaves or enters the king's rank or file
+        (a line piece or a cannon screen), or leaves a leg of a knight jump
+        towards the king. When we are not in check, other moves are legal. """
+    return (not (i - king) & 15 or i >> 4 == king >> 4 or i in knight_legs[king]
+            or not (j - king) & 15 or j >> 4 == king >> 4)
+
+def value(board, move):
+    i, j = move >> 8, move & 255
+    p, q = board[i], board[j]
+    # Actual move
+    score = pst[p][j] - pst[p][i]
+    # Capture
+    if q.islower():
+        score += pst[q.upper()][255-j-1]
+    return score
+
+class Position(namedtuple('Position', 'board score key ours theirs')):
     """ A state of a chess game
     board -- a 256 char representation of the board
     score -- the board evaluation
+    key -- the 64 bit Zobrist key of the board, maintained incrementally
+    ours -- sorted tuple of the squares holding pieces of the side to move
+    theirs -- sorted tuple of the squares holding the opponent's pieces
     """
-    def gen_moves(self):
-        # For each of our pieces, iterate through each possible 'ray' of moves,
-        # as defined in the 'directions' map. The rays are broken e.g. by
-        # captures or immediately in case of pieces such as knights.
-        for i, p in enumerate(self.board):
-            if p == 'K':
-                for scanpos in range(i - 16,A9,-16):
-                    if self.board[scanpos] == 'k':
-                        yield (i,scanpos)
-                    elif self.board[scanpos] != '.':
-                        break
-            if not p.isupper(): continue
-            if p == 'C':
-                for d in directions[p]:
-                    cfoot = 0
-                    for j in count(i+d, d):
-                        q = self.board[j]
-                        if q.isspace():break
-                        if cfoot == 0 and q == '.':yield (i,j)
-                        elif cfoot == 0 and q != '.':cfoot += 1
-                        elif cfoot == 1 and q.islower(): yield (i,j);break
-                        elif cfoot == 1 and q.isupper(): break;
+    def gen_moves(self, quiets=True, captures=True):
+        king = next((k for k in self.theirs if self.board[k] == 'k'), -1)
+        return gen_moves(self.board, self.ours, king, quiets, captures)
+
+    def in_check(self):
+        king = self.board.find('K')
+        return king < 0 or is_attacked(self.board, king)
+
+    def legal_moves(self):
+        ''' gen_moves(), without the moves that leave our king attacked '''
+        board = self.board
+        king = board.find('K')
+        if king < 0:
+            return
+        check = is_attacked(board, king)
+        for move in self.gen_moves():
+            i, j = move >> 8, move & 255
+            p = board[i]
+            if p != 'K' and not check and not may_expose(i, j, king):
+                yield move
                 continue
-            for d in directions[p]:
-                for j in count(i+d, d):
-                    q = self.board[j]
-                    # Stay inside the board, and off friendly pieces
-                    if q.isspace() or q.isupper(): break
-                    # 过河的卒/兵才能横着走
-                    if p == 'P' and d in (E, W) and i > 128: break
-                    # j & 15 等价于 j % 16但是更快
-                    elif p in ('A','K') and (j < 160 or j & 15 > 8 or j & 15 < 6): break
-                    elif p == 'B' and j < 128: break
-                    elif p == 'N':
-                        n_diff_x = (j - i) & 15
-                        if n_diff_x == 14 or n_diff_x == 2:
-                            if self.board[i + (1 if n_diff_x == 2 else -1)] != '.': break
-                        else:
-                            if j > i and self.board[i + 16] != '.': break
-                            elif j < i and self.board[i - 16] != '.': break
-                    elif p == 'B' and self.board[i + d // 2] != '.':break
-                    # Move it
-                    yield (i, j)
-                    # Stop crawlers from sliding, and sliding after captures
-                    if p in 'PNBAK' or q.islower(): break
+            after = board[:j] + p + board[j+1:]
+            after = after[:i] + '.' + after[i+1:]
+            if not is_attacked(after, j if p == 'K' else king):
+                yield move
 
     def rotate(self):
         ''' Rotates the board, preserving enpassant '''
         return Position(
-            self.board[-2::-1].swapcase() + " ", -self.score)
+            self.board[-2::-1].swapcase() + " ", -self.score, swap_halves(self.key),
+            tuple(254 - s for s in reversed(self.theirs)),
+            tuple(254 - s for s in reversed(self.ours)))
 
     def nullmove(self):
         ''' Like rotate, but clears ep and kp '''
         return self.rotate()
 
     def move(self, move):
-        i, j = move
+        i, j = move >> 8, move & 255
         p, q = self.board[i], self.board[j]
         put = lambda board, i, p: board[:i] + p + board[i+1:]
         # Copy variables and reset ep and kp
         board = self.board
         score = self.score + self.value(move)
+        key = self.key ^ zobrist[p][i] ^ zobrist[p][j]
+        ours = tuple(sorted([j] + [s for s in self.ours if s != i]))
+        theirs = self.theirs
+        if q in zobrist:
+            key ^= zobrist[q][j]
+            theirs = tuple(s for s in theirs if s != j)
         # Actual move
         board = put(board, j, board[i])
         board = put(board, i, '.')
-        return Position(board, score).rotate()
+        return Position(board, score, key, ours, theirs).rotate()
 
     def value(self, move):
-        i, j = move
-        p, q = self.board[i], self.board[j]
-        # Actual move
-        score = pst[p][j] - pst[p][i]
-        # Capture
-        if q.islower():
-            score += pst[q.upper()][255-j-1]
-        return score
+        return value(self.board, move)
+
+def make_position(board, score):
+    ''' Builds a Position from a bare board, computing the key and piece lists '''
+    ours = tuple(i for i, p in enumerate(board) if p.isupper())
+    theirs = tuple(i for i, p in enumerate(board) if p.islower())
+    return Position(board, score, zhash(board), ours, theirs)
+
+class Board(object):
+    """ A mutable board used inside the search. Moves are made and unmade in
+    place with an undo stack, instead of building a new Position per node.
+
+    The board is kept from both sides' point of view at once, so passing the
+    turn is just a matter of switching views; nothing is ever rotated.
+    board -- the list of 256 characters seen by the side to move
+    score, key -- as in Position, for the side to move
+    """
+    def __init__(self, pos):
+        rotated = pos.rotate()
+        self.views = [list(pos.board), list(rotated.board)]
+        self.pieces = [list(pos.ours), list(rotated.ours)]
+        self.kings = [pos.board.find('K'), rotated.board.find('K')]
+        self.side = 0
+        self.board = self.views[0]
+        self.score = pos.score
+        self.key = pos.key
+        self.stack = []
+
+    def gen_moves(self, quiets=True, captures=True):
+        return gen_moves(self.board, self.pieces[self.side], 254 - self.kings[1 - self.side],
+                         quiets, captures)
+
+    def mvv_lva(self, move):
+        return mvv_lva(self.board, move)
+
+    def value(self, move):
+        return value(self.board, move)
+
+    def see(self, move):
+        return see(self.board, move)
+
+    def scored_captures(self):
+        """ The captures as a move buffer (see MOVE_MASK), in MVV-LVA order """
+        board = self.board
+        buf = []
+        for move in self.gen_moves(quiets=False):
+            i, j = move >> 8, move & 255
+            p, q = board[i], board[j].upper()
+            buf.append((piece[q] * 4096 - piece[p]) << 32
+                       | pst[p][j] - pst[p][i] + pst[q][254 - j] + GAIN_BIAS << 16 | move)
+        buf.sort(reverse=True)
+        return buf
+
+    def in_check(self):
+        king = self.kings[self.side]
+        return self.board[king] != 'K' or is_attacked(self.board, king)
+
+    def legal_moves(self):
+        ''' gen_moves(), without the moves that leave our king attacked '''
+        king = self.kings[self.side]
+        board = self.board
+        if board[king] != 'K':
+            return
+        check = is_attacked(board, king)
+        for move in list(self.gen_moves()):
+            i, j = move >> 8, move & 255
+            if board[i] != 'K' and not check and not may_expose(i, j, king):
+                yield move
+                continue
+            self.make(move)
+            legal = not is_attacked(self.views[1 - self.side], self.kings[1 - self.side])
+            self.unmake()
+            if legal:
+                yield move
+
+    def make(self, move, gain=None):
+        """ Makes the move, whose value may be given if it is already known """
+        i, j = move >> 8, move & 255
+        side = self.side
+        board, other = self.board, self.views[1 - side]
+        p, q = board[i], board[j]
+        self.stack.append((move, q, self.score, self.key))
+        score = self.score + (value(board, move) if gain is None else gain)
+        key = self.key ^ zobrist[p][i] ^ zobrist[p][j]
+        ours = self.pieces[side]
+        ours.remove(i)
+        insort(ours, j)
+        if q != '.':
+            key ^= zobrist[q][j]
+            self.pieces[1 - side].remove(254 - j)
+        if p == 'K':
+            self.kings[side] = j
+        board[j], board[i] = p, '.'
+        other[254 - j], other[254 - i] = p.swapcase(), '.'
+        self.side, self.board = 1 - side, other
+        self.score, self.key = -score, swap_halves(key)
+
+    def nullmove(self):
+        """ Passes the turn; taken back with unmake() """
+        self.stack.append((None, None, self.score, self.key))
+        self.side = 1 - self.side
+        self.board = self.views[self.side]
+        self.score, self.key = -self.score, swap_halves(self.key)
+
+    def repetition(self):
+        """ Whether the current position stood on the path before. Only the
+            positions since the last capture or null move, with the same side
+            to move, are compared. """
+        stack, key = self.stack, self.key
+        for k in range(len(stack) - 2, -1, -2):
+            if stack[k + 1][1] != '.' or stack[k][1] != '.':
+                return False
+            if stack[k][3] == key:
+                return True
+        return False
+
+    def unmake(self):
+        """ Takes back the last move or null move """
+        move, q, self.score, self.key = self.stack.pop()
+        side = self.side = 1 - self.side
+        board = self.board = self.views[side]
+        if move is None:
+            return
+        i, j = move >> 8, move & 255
+        other = self.views[1 - side]
+        p = board[j]
+        board[i], board[j] = p, q
+        other[254 - i], other[254 - j] = p.swapcase(), q.swapcase()
+        ours = self.pieces[side]
+        ours.remove(j)
+        insort(ours, i)
+        if q != '.':
+            insort(self.pieces[1 - side], 254 - j)
+        if p == 'K':
+            self.kings[side] = i
 
 ###############################################################################
 # Search logic
@@ -245,23 +653,335 @@ class Position(namedtuple('Position', 'board score')):
 # lower <= s(pos) <= upper
 Entry = namedtuple('Entry', 'lower upper')
 
+# The table slots are unsigned 64 bit array items: 'Q', or where the array
+# module has no 'Q' (Python 2), 'L' if that is 64 bits wide.
+try:
+    SLOT_TYPE = array('Q').typecode
+except ValueError:
+    SLOT_TYPE = 'L'
+if array(SLOT_TYPE).itemsize < 8:
+    raise ImportError('The transposition table needs a 64 bit array type')
+
+class TranspositionTable(object):
+    """ A fixed size transposition table. Entries are keyed on the position key,
+    the search depth and whether the position is the root, and keep score
+    bounds and the best move found.
+
+    The table is split into buckets of two slots: the first slot prefers deep
+    entries, the second always takes the newest one. Entries left over from
+    earlier searches are replaced first. Every slot is two unsigned 64 bit
+    ints in flat arrays: the position key xor the packed entry, and the entry
+        bits  0-15 lower bound + SCORE_BIAS    bits 48-56 depth << 1 | root
+        bits 16-31 upper bound + SCORE_BIAS    bit  57    path dependent
+        bits 32-47 move, from << 8 | to        bits 58-63 search age
+                   (0 is no move)
+
+    Path dependent bounds, those that relied on a repetition inside the
+    search tree, only hold for the search that stored them, and are not
+    returned to later ones.
+
+    With shared=True the arrays live in shared memory, where processes
+    searching in parallel read and write them without locks. A slot torn by
+    two writers no longer xors back to its key, so it is simply a miss. Other
+    processes attach to the table by its name.
+    """
+    SLOT_BYTES = 16
+    SCORE_BIAS = 1 << 15
+
+    def __init__(self, mb=None, shared=False, name=None):
+        if mb is None:
+            mb = TABLE_MB
+        buckets = max(1, int(mb * 2**20) // (2 * self.SLOT_BYTES))
+        buckets = 1 << (buckets.bit_length() - 1)
+        self.mb = mb
+        self.mask = buckets - 1
+        self.age = 0
+        # Entries of the current search pushed out by those of other
+        # positions, in this process
+        self.evictions = 0
+        self.shm, self.owner = None, name is None
+        if shared or name:
+            size = 2 * buckets * self.SLOT_BYTES
+            self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+            self.slots = self.shm.buf[:size].cast('Q')
+            self.keys, self.data = self.slots[:2 * buckets], self.slots[2 * buckets:]
+        else:
+            self.keys = array(SLOT_TYPE, [0]) * (2 * buckets)
+            self.data = array(SLOT_TYPE, [0]) * (2 * buckets)
+
+    @property
+    def name(self):
+        return self.shm.name if self.shm else None
+
+    def share(self):
+        """ A copy of the table in shared memory """
+        table = TranspositionTable(self.mb, shared=True)
+        table.keys[:], table.data[:] = self.keys, self.data
+        table.age = self.age
+        return table
+
+    def close(self):
+        """ Lets go of the shared memory, freeing it if we made it """
+        if self.shm:
+            for view in (self.keys, self.data, self.slots):
+                view.release()
+            self.shm.close()
+            if self.owner:
+                self.shm.unlink()
+            self.shm = None
+
+    def __del__(self):
+        self.close()
+
+    def new_search(self):
+        """ Starts a new search. Entries of older searches stay usable, but
+            become the first to be replaced. """
+        self.age = (self.age + 1) & 63
+
+    def clear(self):
+        self.keys[:] = array(SLOT_TYPE, [0]) * len(self.keys)
+        self.data[:] = array(SLOT_TYPE, [0]) * len(self.data)
+
+    def fill(self, sample=FILL_SAMPLE):
+        """ The share of the table holding entries of the current search,
+            estimated from the first sample slots """
+        sample = min(sample, len(self.data))
+        return sum(1 for d in self.data[:sample] if d and d >> 58 == self.age) / sample
+
+    def get(self, key, depth, root):
+        """ The stored bounds for the position at this depth """
+        i = (key & self.mask) << 1
+        tag = depth << 1 | root
+        for s in (i, i + 1):
+            d = self.data[s]
+            if (self.keys[s] ^ d == key and d >> 48 & 511 == tag
+                    and not (d >> 57 & 1 and d >> 58 != self.age)):
+                return Entry((d & 0xffff) - self.SCORE_BIAS, (d >> 16 & 0xffff) - self.SCORE_BIAS)
+        return Entry(-MATE_UPPER, MATE_UPPER)
+
+    def get_move(self, key):
+        """ The best move stored for the position at any depth, or None """
+        i = (key & self.mask) << 1
+        for s in (i, i + 1):
+            d = self.data[s]
+            if self.keys[s] ^ d == key:
+                m = d >> 32 & 0xffff
+                if m:
+                    return m
+        return None
+
+    def put(self, key, depth, root, lower, upper, move=None, path=False):
+        """ Stores the bounds, and the move if given. Without a move, the move
+            already known for the position is kept. path marks the bounds as
+            path dependent. """
+        i = (key & self.mask) << 1
+        keys, data = self.keys, self.data
+        tag = depth << 1 | root
+        m = 0
+        if move is not None:
+            m = move
+        else:
+            for s in (i, i + 1):
+                if keys[s] ^ data[s] == key:
+                    m = m or data[s] >> 32 & 0xffff
+        d = (lower + self.SCORE_BIAS | (upper + self.SCORE_BIAS) << 16 | m << 32
+             | tag << 48 | path << 57 | self.age << 58)
+        # Update the entry in place if we have it already. Bounds merged with
+        # path dependent ones of this search stay path dependent.
+        for s in (i, i + 1):
+            old = data[s]
+            if keys[s] ^ old == key and old >> 48 & 511 == tag:
+                if old >> 58 == self.age:
+                    d |= old & 1 << 57
+                keys[s], data[s] = key ^ d, d
+                return
+        # Otherwise the depth preferred slot takes it if it is at least as deep
+        # as what is there, or what is there is stale, and hands its old entry
+        # down to the always replace slot. Either way the entry in that slot
+        # is lost, which counts as an eviction if it was of this search.
+        old = data[i + 1]
+        if old and old >> 58 == self.age and keys[i + 1] ^ old != key:
+            self.evictions += 1
+        old = data[i]
+        if not old or old >> 58 != self.age or old >> 49 & 255 <= depth:
+            keys[i + 1], data[i + 1] = keys[i], old
+            keys[i], data[i] = key ^ d, d
+        else:
+            keys[i + 1], data[i + 1] = key ^ d, d
+
+    def put_move(self, key, move):
+        """ Stores just the move, for the entries of the position we have. If
+            there are none, it goes to the always replace slot without bounds,
+            so no deeper entry is lost for it. """
+        i = (key & self.mask) << 1
+        keys, data = self.keys, self.data
+        found = False
+        for s in (i, i + 1):
+            old = data[s]
+            if keys[s] ^ old == key:
+                d = old & ~(0xffff << 32) | move << 32
+                keys[s], data[s] = key ^ d, d
+                found = True
+        if not found:
+            old = data[i + 1]
+            if old and old >> 58 == self.age:
+                self.evictions += 1
+            d = (-MATE_UPPER + self.SCORE_BIAS | (MATE_UPPER + self.SCORE_BIAS) << 16
+                 | move << 32 | self.age << 58)
+            keys[i + 1], data[i + 1] = key ^ d, d
+
+class SearchStats(object):
+    """ Counters of a search, for finding out why it was slow. The Searcher
+    keeps them while STATS is on, and yields a copy of them with every depth,
+    which the depths after it leave alone; as_dict() has them all, ready for
+    json.
+    qs_nodes -- the nodes searched in quiescence, out of nodes
+    tt_probes, tt_hits, tt_cutoffs -- table lookups, the ones that found
+        bounds for the position, and the ones that settled the node
+    cutoffs, first_cutoffs -- fail highs on a move, and those on the first
+        move tried; their ratio tells how good the move ordering is
+    depths -- a dict per finished depth, of its time, nodes, effective
+        branching factor (nodes over those of the depth before) and root
+        researches (None for searches that don't count them)
+    table_fill, evictions -- the share of the table filled by this search, and
+        how many of its entries were pushed out again
+    Null move tries and cutoffs, along with the other prunings, are counted in
+    Searcher.pruning, and copied here after every depth.
+    """
+    def __init__(self, tp=None):
+        self.start = self.last_time = time.time()
+        self.nodes = self.qs_nodes = 0
+        self.tt_probes = self.tt_hits = self.tt_cutoffs = 0
+        self.cutoffs = self.first_cutoffs = 0
+        self.depths = []
+        self.pruning = {}
+        self.table_fill = 0
+        self.evictions = 0
+        self.start_evictions = tp.evictions if tp else 0
+
+    def end_depth(self, searcher, depth):
+        """ Takes note of a finished depth, and returns a copy of the counters
+            as they are now """
+        now = time.time()
+        nodes = searcher.nodes - self.nodes
+        last = self.depths[-1]['nodes'] if self.depths else 0
+        self.depths.append({
+            'depth': depth,
+            'time': now - self.last_time,
+            'nodes': nodes,
+            'ebf': nodes / last if last else None,
+            'researches': searcher.researches.get(depth),
+        })
+        self.last_time, self.nodes = now, searcher.nodes
+        self.pruning = dict(searcher.pruning)
+        self.table_fill = searcher.tp.fill()
+        self.evictions = searcher.tp.evictions - self.start_evictions
+        snapshot = copy.copy(self)
+        snapshot.depths = [dict(d) for d in self.depths]
+        return snapshot
+
+    def as_dict(self):
+        res = {k: v for k, v in vars(self).items() if k not in ('start', 'last_time', 'start_evictions')}
+        res['time'] = self.last_time - self.start
+        res['null_tries'] = self.pruning.get('null', 0)
+        res['null_cutoffs'] = self.pruning.get('null_cutoff', 0)
+        return res
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.as_dict(), **kwargs)
+
+class SearchAborted(Exception):
+    """ Raised inside bound() when the search runs past its deadline or node
+        budget, or is stopped """
+
 class Searcher:
-    def __init__(self):
-        self.tp_score = {}
-        self.tp_move = {}
+    def __init__(self, table_mb=None, tp=None):
+        self.tp = tp or TranspositionTable(table_mb)
         self.history = set()
+        self.history_hits = 0
+        # Repetitions found inside the tree
+        self.path_draws = 0
         self.nodes = 0
+        # Quiet move ordering: two killer moves per ply, history scores by
+        # piece and target square, and the reply that last refuted a move.
+        self.killers = []
+        self.history_scores = {p: [0] * 256 for p in 'PNBRACK'}
+        self.counter_moves = {}
+        self.pruning = Counter()
+        # Number of root searches beyond the first one at each depth
+        self.researches = {}
+        self.stats = SearchStats(self.tp)
+        # The move of the last fail high at the root, in the current depth
+        self.root_move = None
+        # Limits of the current search, see search()
+        self.deadline = self.max_nodes = self.stop = None
+        self.abortable = False
+
+    def counter_key(self, pos):
+        """ The opponent's last move as (piece, square) seen from our side, or
+            None at the root and after a null move """
+        if pos.stack and pos.stack[-1][0]:
+            j = 254 - (pos.stack[-1][0] & 255)
+            return pos.board[j], j
 
-    def bound(self, pos, gamma, depth, root=True):
-        """ returns r where
+    def age_history(self):
+        for scores in self.history_scores.values():
+            scores[:] = [h >> 1 for h in scores]
+
+    def quiet_moves(self, pos, ply):
+        """ The quiet moves of pos as a move buffer (see MOVE_MASK) in search
+            order: the killers and the counter move, if they can be played
+            here, then the rest by history score, with the PST delta as a tie
+            break """
+        # The first moves get keys above any history score
+        first, top = {}, 4 * HISTORY_MAX
+        for move in self.killers[ply] + [self.counter_moves.get(self.counter_key(pos))]:
+            if move is not None and move not in first:
+                first[move] = top - len(first)
+        board, history = pos.board, self.history_scores
+        buf = []
+        for move in pos.gen_moves(captures=False):
+            i, j = move >> 8, move & 255
+            p = board[i]
+            buf.append((first.get(move) or history[p][j]) << 32
+                       | pst[p][j] - pst[p][i] + GAIN_BIAS << 16 | move)
+        buf.sort(reverse=True)
+        return buf
+
+    def record_cutoff(self, pos, move, depth, ply):
+        """ Remembers a quiet move that failed high at pos """
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[0], killers[1] = move, killers[0]
+        scores = self.history_scores[pos.board[move >> 8]]
+        scores[move & 255] += depth * depth
+        if scores[move & 255] > HISTORY_MAX:
+            self.age_history()
+        key = self.counter_key(pos)
+        if key:
+            self.counter_moves[key] = move
+
+    def check_limits(self):
+        if (self.deadline is not None and time.time() > self.deadline
+                or self.max_nodes is not None and self.nodes >= self.max_nodes
+                or self.stop is not None and self.stop.is_set()):
+            raise SearchAborted()
+
+    def bound(self, pos, gamma, depth, root=True, null=True):
+        """ pos is a Board, which is left as it was found. Returns r where
                 s(pos) <= r < gamma    if gamma > s(pos)
-                gamma <= r <= s(pos)   if gamma <= s(pos)"""
+                gamma <= r <= s(pos)   if gamma <= s(pos)
+            null=False forbids a null move at this node (but not below it). """
         self.nodes += 1
+        if self.abortable and self.nodes % POLL_NODES == 0:
+            self.check_limits()
 
         # Depth <= 0 is QSearch. Here any position is searched as deeply as is needed for
         # calmness, and from this point on there is no difference in behaviour depending on
         # depth, so so there is no reason to keep different depths in the transposition table.
         depth = max(depth, 0)
+        if STATS and depth == 0:
+            self.stats.qs_nodes += 1
 
         # Sunfish is a king-capture engine, so we should always check if we
         # still have a king. Notice since this is the only termination check,
@@ -270,22 +990,43 @@ class Searcher:
         if pos.score <= -MATE_LOWER:
             return -MATE_UPPER
 
-        # We detect 3-fold captures by comparing against previously
-        # _actually played_ positions.
+        # We detect repetitions by comparing against previously _actually
+        # played_ positions, and against those on the path from the root.
         # Note that we need to do this before we look in the table, as the
         # position may have been previously reached with a different score.
-        # This is what prevents a search instability.
-        # FIXME: This is not true, since other positions will be affected by
-        # the new values for all the drawn positions.
-        if DRAW_TEST:
-            if not root and pos in self.history:
+        # Draws with the game history depend on it rather than on the position,
+        # so we count them, and scores that relied on one are kept out of the
+        # table (see below). That is what lets the table stay valid from one
+        # move, or game, to the next. The played positions are a set, which
+        # stands for scanning on past the root: those from before a capture
+        # can't come back anyway.
+        # Scores that relied on a draw inside the tree depend on the path too,
+        # but keeping them out as well costs a lot of nodes in exactly the
+        # closed positions where they come up. They are stored marked as path
+        # dependent instead, which the table only hands back within this search.
+        if DRAW_TEST and not root:
+            if pos.key in self.history:
+                self.history_hits += 1
+                return 0
+            if pos.repetition():
+                self.pruning['repetition'] += 1
+                self.path_draws += 1
                 return 0
 
         # Look in the table if we have already searched this position before.
         # We also need to be sure, that the stored search was over the same
-        # nodes as the current search.
-        entry = self.tp_score.get((pos, depth, root), Entry(-MATE_UPPER, MATE_UPPER))
-        if entry.lower >= gamma and (not root or self.tp_move.get(pos) is not None):
+        # nodes as the current search. At the root a fail high also needs a
+        # move of our own from this depth, as the table may be shared with
+        # helpers searching deeper.
+        entry = self.tp.get(pos.key, depth, root)
+        if STATS:
+            stats = self.stats
+            stats.tt_probes += 1
+            if entry.lower != -MATE_UPPER or entry.upper != MATE_UPPER:
+                stats.tt_hits += 1
+                stats.tt_cutoffs += entry.upper < gamma or entry.lower >= gamma and (
+                    not root or self.root_move is not None)
+        if entry.lower >= gamma and (not root or self.root_move is not None):
             return entry.lower
         if entry.upper < gamma:
             return entry.upper
@@ -293,42 +1034,150 @@ class Searcher:
         # Here extensions may be added
         # Such as 'if in_check: depth += 1'
 
+        history_hits, path_draws = self.history_hits, self.path_draws
+        ply = len(pos.stack)
+        while len(self.killers) <= ply:
+            self.killers.append([None, None])
+
+        # Selective search. None of it applies at the root or in check, and the
+        # margin based prunings, which could miss a mate, not near mate scores.
+        selective = depth > 0 and not root and not pos.in_check()
+        marginal = selective and abs(gamma) < MATE_LOWER
+        # Reverse futility: so far above gamma that a shallow search is not
+        # going to bring us below it.
+        if REVERSE_FUTILITY and marginal and depth <= REVERSE_FUTILITY_DEPTH:
+            margin = pos.score - REVERSE_FUTILITY_MARGIN * depth
+            if margin >= gamma:
+                self.pruning['reverse_futility'] += 1
+                return margin
+        # Razoring: so far below gamma that only captures could help, so we
+        # ask the quiescence search.
+        if RAZORING and marginal and depth <= RAZOR_DEPTH:
+            if pos.score + RAZOR_MARGIN * depth < gamma:
+                score = self.bound(pos, gamma, 0, root=False)
+                if score < gamma:
+                    self.pruning['razor'] += 1
+                    return score
+        # Futility: at the last plies, quiet moves that can't bring the score
+        # up to gamma with a margin are not searched.
+        futile = FUTILITY and marginal and depth <= FUTILITY_DEPTH
+
         # Generator of moves to search in order.
         # This allows us to define the moves, but only calculate them if needed.
         def moves():
             # First try not moving at all. We only do this if there is at least one major
             # piece left on the board, since otherwise zugzwangs are too dangerous.
-            if depth > 0 and not root and any(c in pos.board for c in 'RNC'):
-                yield None, -self.bound(pos.nullmove(), 1-gamma, depth-3, root=False)
+            # With few of them left we verify the cutoff with a normal search.
+            majors = NULL_MOVE and null and selective and sum(
+                1 for i in pos.pieces[pos.side] if pos.board[i] in 'RNC')
+            if majors:
+                r = NULL_R + (depth >= NULL_DEEP_DEPTH)
+                self.pruning['null'] += 1
+                pos.nullmove()
+                score = -self.bound(pos, 1-gamma, depth-1-r, root=False)
+                pos.unmake()
+                if score >= gamma and majors <= NULL_VERIFY_MAJORS:
+                    self.pruning['null_verify'] += 1
+                    if self.bound(pos, gamma, depth-1-r, root=False, null=False) < gamma:
+                        self.pruning['null_verify_fail'] += 1
+                        score = -MATE_UPPER
+                if score >= gamma:
+                    self.pruning['null_cutoff'] += 1
+                yield None, score
             # For QSearch we have a different kind of null-move, namely we can just stop
             # and not capture anythign else.
             if depth == 0:
                 yield None, pos.score
-            # Then killer move. We search it twice, but the tp will fix things for us.
+            # Then the move from the table.
             # Note, we don't have to check for legality, since we've already done it
-            # before. Also note that in QS the killer must be a capture, otherwise we
+            # before. Also note that in QS the move must be a capture, otherwise we
             # will be non deterministic.
-            killer = self.tp_move.get(pos)
-            if killer and (depth > 0 or pos.value(killer) >= QS_LIMIT):
-                yield killer, -self.bound(pos.move(killer), 1-gamma, depth-1, root=False)
-            # Then all the other moves
-            for move in sorted(pos.gen_moves(), key=pos.value, reverse=True):
-            #for val, move in sorted(((pos.value(move), move) for move in pos.gen_moves()), reverse=True):
-                # If depth == 0 we only try moves with high intrinsic score (captures and
-                # promotions). Otherwise we do all moves.
-                if depth > 0 or pos.value(move) >= QS_LIMIT:
-                    yield move, -self.bound(pos.move(move), 1-gamma, depth-1, root=False)
+            hash_move = self.tp.get_move(pos.key)
+            if hash_move:
+                gain = pos.value(hash_move)
+                if depth > 0 or gain >= QS_LIMIT:
+                    pos.make(hash_move, gain)
+                    score = -self.bound(pos, 1-gamma, depth-1, root=False)
+                    pos.unmake()
+                    yield hash_move, score
+            # Then the other moves in stages, each generated only once the
+            # previous one failed to cut: captures, most valuable victim first,
+            # and then the quiet moves. If depth == 0 we only try captures with
+            # a high intrinsic score. Otherwise we do all moves. The move
+            # buffers come with the value of every move, for the QS_LIMIT,
+            # delta and futility tests and for make().
+            board, losing = pos.board, []
+            for entry in pos.scored_captures():
+                move, gain = entry & MOVE_MASK, (entry >> 16 & 0xffff) - GAIN_BIAS
+                if move == hash_move or depth == 0 and gain < QS_LIMIT:
+                    continue
+                if DELTA_PRUNING and depth == 0 and pos.score + gain + DELTA_MARGIN < gamma:
+                    # Like futility, the capture fails low by the margin
+                    self.pruning['delta'] += 1
+                    yield move, pos.score + gain + DELTA_MARGIN
+                    continue
+                # Taking a piece worth at least the taker can't lose material,
+                # so only the others need the exchange worked out.
+                if (SEE_PRUNING and piece[board[move & 255].upper()] < piece[board[move >> 8]]
+                        and pos.see(move) < 0):
+                    if depth > 0:
+                        self.pruning['see_late'] += 1
+                        losing.append((move, gain))
+                    else:
+                        self.pruning['see'] += 1
+                    continue
+                pos.make(move, gain)
+                score = -self.bound(pos, 1-gamma, depth-1, root=False)
+                pos.unmake()
+                yield move, score
+            if depth > 0:
+                killers = self.killers[ply]
+                for n, entry in enumerate(self.quiet_moves(pos, ply)):
+                    move, gain = entry & MOVE_MASK, (entry >> 16 & 0xffff) - GAIN_BIAS
+                    if move == hash_move:
+                        continue
+                    if futile:
+                        # The pruned move counts as failing low by the margin
+                        margin = pos.score + gain + FUTILITY_MARGIN * depth
+                        if margin < gamma:
+                            self.pruning['futility'] += 1
+                            yield move, margin
+                            continue
+                    r = 0
+                    if (LATE_MOVE_REDUCTION and selective and depth >= LMR_DEPTH
+                            and n >= LMR_MOVES and move not in killers):
+                        r = 1 + (n >= LMR_MOVES_DEEP and depth > LMR_DEPTH)
+                        self.pruning['lmr'] += 1
+                    pos.make(move, gain)
+                    score = -self.bound(pos, 1-gamma, depth-1-r, root=False)
+                    if r and score >= gamma:
+                        self.pruning['lmr_research'] += 1
+                        score = -self.bound(pos, 1-gamma, depth-1, root=False)
+                    pos.unmake()
+                    yield move, score
+                # The captures that lose material come last
+                for move, gain in losing:
+                    pos.make(move, gain)
+                    score = -self.bound(pos, 1-gamma, depth-1, root=False)
+                    pos.unmake()
+                    yield move, score
 
         # Run through the moves, shortcutting when possible
-        best = -MATE_UPPER
+        best, best_move, tried = -MATE_UPPER, None, 0
         for move, score in moves():
             best = max(best, score)
             if best >= gamma:
-                # Clear before setting, so we always have a value
-                if len(self.tp_move) > TABLE_SIZE: self.tp_move.clear()
                 # Save the move for pv construction and killer heuristic
-                self.tp_move[pos] = move
+                best_move = move
+                if root:
+                    self.root_move = move
+                if move is not None and depth > 0 and pos.board[move & 255] == '.':
+                    self.record_cutoff(pos, move, depth, ply)
+                if STATS and move is not None:
+                    self.stats.cutoffs += 1
+                    self.stats.first_cutoffs += not tried
                 break
+            tried += move is not None
 
         # Stalemate checking is a bit tricky: Say we failed low, because
         # we can't (legally) move and so the (real) score is -infty.
@@ -341,50 +1190,299 @@ class Searcher:
         # but only if depth == 1, so that's probably fair enough.
         # (Btw, at depth 1 we can also mate without realizing.)
         if best < gamma and best < 0 and depth > 0:
-            is_dead = lambda pos: any(pos.value(m) >= MATE_LOWER for m in pos.gen_moves())
-            if all(is_dead(pos.move(m)) for m in pos.gen_moves()):
-                in_check = is_dead(pos.nullmove())
-                best = -MATE_UPPER if in_check else 0
-
-        # Clear before setting, so we always have a value
-        if len(self.tp_score) > TABLE_SIZE: self.tp_score.clear()
-        # Table part 2
-        if best >= gamma:
-            self.tp_score[pos, depth, root] = Entry(best, entry.upper)
-        if best < gamma:
-            self.tp_score[pos, depth, root] = Entry(entry.lower, best)
+            if not any(True for _ in pos.legal_moves()):
+                best = -MATE_UPPER if pos.in_check() else 0
+
+        # Table part 2. If a history draw was seen below us, the score only holds
+        # for this game history, so we keep just the move. After a draw inside
+        # the tree, it only holds for this search.
+        path = self.path_draws != path_draws
+        if self.history_hits != history_hits:
+            if best >= gamma and best_move is not None:
+                self.tp.put_move(pos.key, best_move)
+        elif best >= gamma:
+            self.tp.put(pos.key, depth, root, best, entry.upper, best_move, path)
+        elif best < gamma:
+            self.tp.put(pos.key, depth, root, entry.lower, best, path=path)
 
         return best
 
-    def search(self, pos, history=()):
-        """ Iterative deepening MTD-bi search """
+    def search(self, pos, history=(), threads=1, deadline=None, max_nodes=None, stop=None):
+        """ Iterative deepening MTD-bi search with aspiration. Yields
+            (depth, move, score, stats) after every depth, stats being the
+            SearchStats of the search so far.
+
+            The search ends by itself, in the middle of a depth, once time.time()
+            passes deadline, it has searched max_nodes nodes, or stop (say, a
+            threading.Event) is set. The last depth yielded is then the result.
+            The first depth always runs to completion, so there is a move.
+
+            With threads > 1, threads - 1 helper processes search the same
+            position alongside us, sharing the transposition table (Lazy SMP).
+            Half of them run a depth ahead. Our own moves and scores, which
+            profit from what the helpers stored, are the ones reported. """
         self.nodes = 0
+        self.deadline, self.max_nodes, self.stop = deadline, max_nodes, stop
+        self.abortable = False
+        self.researches = {}
         if DRAW_TEST:
-            self.history = set(history)
-            # print('# Clearing table due to new history')
-            self.tp_score.clear()
+            self.history = set(p.key for p in history)
+        # The table is kept from earlier searches, as it holds no scores
+        # that depend on the history, and hands back those that depend on the
+        # path only to the search that stored them.
+        self.tp.new_search()
+        # Killers belong to the positions of the last search, but what the
+        # history scores learnt is still worth something.
+        self.killers = []
+        self.age_history()
+        self.pruning.clear()
+
+        helpers = []
+        if threads > 1 and shared_memory and not self.tp.shm:
+            self.tp = self.tp.share()
+        # After the table is shared, as the stats start from its counters
+        self.stats = SearchStats(self.tp)
+        if threads > 1 and shared_memory:
+            for i in range(threads - 1):
+                helpers.append(multiprocessing.Process(target=smp_helper, daemon=True, args=(
+                    type(self), self.tp.name, self.tp.mb, self.tp.age, pos, self.history, 1 + (i % 2 == 0))))
+                helpers[-1].start()
+        try:
+            for result in self.iterate(pos):
+                yield result
+        finally:
+            # Helpers only ever write whole slots under the key check, so
+            # they can be killed at any time.
+            for helper in helpers:
+                helper.terminate()
+            for helper in helpers:
+                helper.join()
+
+    def iterate(self, root, first_depth=1):
+        """ The iterative deepening loop of search(), from first_depth on """
+        # The search makes and unmakes its moves on a private mutable board.
+        pos = Board(root)
 
         # In finished games, we could potentially go far enough to cause a recursion
         # limit exception. Hence we bound the ply.
-        for depth in range(1, 1000):
-            # The inner loop is a binary search on the score of the position.
-            # Inv: lower <= score <= upper
-            # 'while lower != upper' would work, but play tests show a margin of 20 plays
-            # better.
-            lower, upper = -MATE_UPPER, MATE_UPPER
-            while lower < upper - EVAL_ROUGHNESS:
-                gamma = (lower+upper+1)//2
-                score = self.bound(pos, gamma, depth)
-                if score >= gamma:
-                    lower = score
-                if score < gamma:
-                    upper = score
-            # We want to make sure the move to play hasn't been kicked out of the table,
-            # So we make another call that must always fail high and thus produce a move.
-            self.bound(pos, lower, depth)
-            # If the game hasn't finished we can retrieve our move from the
-            # transposition table.
-            yield depth, self.tp_move.get(pos), self.tp_score.get((pos, depth, True),Entry(-MATE_UPPER, MATE_UPPER)).lower
+        guess = root.score
+        try:
+            for depth in range(first_depth, 1000):
+                guess, move = self.search_depth(pos, depth, guess)
+                # Having a move, the search may be cut short. It is our own,
+                # rather than what the table holds, which may be a helper's.
+                self.abortable = True
+                yield depth, move, guess, self.stats.end_depth(self, depth)
+        except SearchAborted:
+            # The last depth yielded stands
+            pass
+
+    def search_depth(self, pos, depth, guess):
+        """ The score and best move of the Board pos searched to depth, given
+            the score of the last depth as a guess. Other search strategies
+            override this, and the node search. """
+        self.root_move = None
+        # The loop is a binary search on the score of the position.
+        # Inv: lower <= score <= upper
+        # 'while lower != upper' would work, but play tests show a margin of 20 plays
+        # better.
+        # With aspiration the first test is at the last depth's score, which
+        # is usually close, and while one side of the range is still open
+        # we step out from the other in growing steps instead of halving.
+        lower, upper = -MATE_UPPER, MATE_UPPER
+        delta, probes = ASPIRATION_DELTA, 0
+        while lower < upper - EVAL_ROUGHNESS:
+            gamma = (lower+upper+1)//2
+            if ASPIRATION:
+                if probes == 0:
+                    gamma = guess
+                elif upper == MATE_UPPER:
+                    gamma, delta = min(gamma, lower + delta), delta * 2
+                elif lower == -MATE_UPPER:
+                    gamma, delta = max(gamma, upper - delta), delta * 2
+            score = self.bound(pos, gamma, depth)
+            probes += 1
+            if score >= gamma:
+                lower = score
+            if score < gamma:
+                upper = score
+        self.researches[depth] = probes - 1
+        # We want to make sure we have a move to play, so we make another call
+        # that must always fail high and thus produce one.
+        score = self.bound(pos, lower, depth)
+        return max(score, lower), self.root_move
+
+def smp_helper(cls, name, mb, age, pos, history, first_depth):
+    """ A Lazy SMP helper process: searches pos with a searcher of class cls
+        until it is terminated, and only leaves its results in the shared table """
+    searcher = cls(tp=TranspositionTable(mb, name=name))
+    searcher.tp.age, searcher.history = age, history
+    for _ in searcher.iterate(pos, first_depth):
+        pass
+
+class TimeManager(object):
+    """ Time control for a search. Between depths it estimates what the next
+    one will cost, from the time the last one took and the effective branching
+    factor seen so far, and only starts it if it is expected to finish within
+    the budget. The budget grows while the best move keeps changing.
+    soft -- the budget in seconds
+    hard -- the deadline, in seconds from the start, at which the search is
+            stopped even in the middle of a depth; HARD_FACTOR * soft by default
+    """
+    HARD_FACTOR = 2
+    # Each recent change of the best move extends the budget by this share of
+    # soft (never past hard). The count halves with every depth that keeps it.
+    INSTABILITY = 0.5
+    # Branching factor assumed until two depths of some size have been seen
+    DEFAULT_EBF = 3
+    MIN_NODES = 100
+    # The branching factor is the geometric mean of the node ratios of the
+    # last EBF_DEPTHS depths, each clamped to MAX_EBF, since those of MTD-bi
+    # jump around from one depth to the next.
+    EBF_DEPTHS = 4
+    MAX_EBF = 6
+
+    def __init__(self, soft=THINK_TIME, hard=None):
+        self.soft = soft
+        self.hard = soft * self.HARD_FACTOR if hard is None else hard
+        self.start = time.time()
+
+    @classmethod
+    def for_clock(cls, remaining, increment=0, opponent=None, moves_to_go=30):
+        """ The time control for a move with remaining seconds on our clock and
+            increment seconds added per move: a share of what is left, plus a
+            tenth of any lead over the opponent's clock """
+        soft = remaining / moves_to_go + increment
+        if opponent is not None:
+            soft += (remaining - opponent) / 10
+        soft = max(soft, increment)
+        return cls(soft, max(soft, min(soft * cls.HARD_FACTOR, remaining / 2)))
+
+    @property
+    def deadline(self):
+        return self.start + self.hard
+
+    def search(self, searcher, pos, history=(), **kwargs):
+        """ Runs searcher.search(pos, history, **kwargs) under this time
+            control, yielding what it yields """
+        self.start = self.last_time = time.time()
+        self.last_nodes = self.last_cost = 0
+        self.ebf, self.move, self.changes = None, None, 0
+        self.ratios = []
+        try:
+            results = searcher.search(pos, history, deadline=self.deadline, **kwargs)
+        except TypeError:
+            # A searcher without deadlines can only be stopped between depths
+            results = searcher.search(pos, history, **kwargs)
+        try:
+            for result in results:
+                yield result
+                if not self.next_depth(result[1], searcher.nodes):
+                    break
+        finally:
+            results.close()
+
+    def next_depth(self, move, nodes):
+        """ Takes note of a finished depth, given its best move and the node
+            count of the search so far. Returns whether to start another. """
+        now = time.time()
+        cost = nodes - self.last_nodes
+        if self.last_cost >= self.MIN_NODES:
+            self.ratios.append(min(max(cost / self.last_cost, 1), self.MAX_EBF))
+            ratios = self.ratios[-self.EBF_DEPTHS:]
+            product = 1
+            for ratio in ratios:
+                product *= ratio
+            self.ebf = product ** (1 / len(ratios))
+        expected = (now - self.last_time) * (self.ebf or self.DEFAULT_EBF)
+        self.last_time, self.last_nodes, self.last_cost = now, nodes, cost
+        self.changes /= 2
+        if self.move is not None and move != self.move:
+            self.changes += 1
+        self.move = move
+        budget = min(self.soft * (1 + self.INSTABILITY * self.changes), self.hard)
+        return now - self.start + expected <= budget
+
+def split_search(pos, depth, history=(), workers=None, share_alpha=True, table_mb=16):
+    """ Root split parallel search, for analysis rather than play: the legal
+    root moves are handed out to a pool of worker processes, which search the
+    positions after them to depth - 1 with searchers of their own. Returns
+    (move, score, pv), pv being the list of moves from pos, each seen from the
+    side making it.
+
+    With share_alpha, the best score found so far sits in a shared memory
+    cell, and workers only prove that their moves are no better than it. The
+    cell is written without a lock; a lost update only means a lower alpha.
+    Without share_alpha every move gets an exact score, which costs more but
+    makes the result the same from run to run whatever the scheduling.
+    """
+    history = set(p.key for p in history)
+    moves = sorted(pos.legal_moves(), key=pos.value, reverse=True)
+    if not moves:
+        return None, -MATE_UPPER if pos.in_check() else 0, []
+    cell = None
+    if share_alpha and shared_memory:
+        cell = shared_memory.SharedMemory(create=True, size=8)
+        cell.buf.cast('q')[0] = -MATE_UPPER
+    try:
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(split_worker, [
+                (pos, move, depth, history, table_mb, cell and cell.name) for move in moves]))
+    finally:
+        if cell:
+            cell.close()
+            cell.unlink()
+    # Fail lows only bound a move's score from above. Ties go to the move
+    # generated first.
+    score, i = max((score, -i) for i, (score, exact, _) in enumerate(results) if exact)
+    return moves[-i], score, [moves[-i]] + results[-i][2]
+
+def split_worker(args):
+    """ Scores one root move for split_search(). Returns (score, exact, pv),
+        where the score is only an upper bound if not exact. """
+    pos, move, depth, history, table_mb, alpha_name = args
+    child = pos.move(move)
+    if child.key in history:
+        return 0, True, []
+    cell = alpha_name and shared_memory.SharedMemory(name=alpha_name)
+    alpha = cell.buf.cast('q') if cell else None
+    searcher = Searcher(table_mb)
+    searcher.history = history
+    board = Board(child)
+    # Warm up the tables a depth short, then bisect the score of the child.
+    # A move is better than alpha iff the child scores below -alpha, so that
+    # is where we test first whenever it falls inside the range.
+    for d, _, _, _ in searcher.iterate(child):
+        if d >= depth - 2:
+            break
+    lower, upper = -MATE_UPPER, MATE_UPPER
+    d = max(depth - 1, 1)
+    exact = True
+    while lower < upper - EVAL_ROUGHNESS:
+        gamma = (lower + upper + 1) // 2
+        if alpha is not None:
+            if lower >= -alpha[0]:
+                exact = False
+                break
+            gamma = min(gamma, -alpha[0])
+        score = searcher.bound(board, gamma, d)
+        if score >= gamma:
+            lower = score
+        if score < gamma:
+            upper = score
+    if exact and alpha is not None and -upper > alpha[0]:
+        alpha[0] = -upper
+    pv, p = [], child
+    while len(pv) < d:
+        m = searcher.tp.get_move(p.key)
+        if m is None or m not in p.legal_moves():
+            break
+        pv.append(m)
+        p = p.move(m)
+    if cell:
+        alpha.release()
+        cell.close()
+    return (-upper if exact else -lower), exact, pv
 
 ###############################################################################
 # User interface
@@ -413,7 +1511,7 @@ def print_pos(pos):
     print('    ａｂｃｄｅｆｇｈｉ\n\n')
 
 def main():
-    hist = [Position(initial, 0)]
+    hist = [make_position(initial, 0)]
     searcher = Searcher()
     while True:
         print_pos(hist[-1])
@@ -424,10 +1522,10 @@ def main():
 
         # We query the user until she enters a (pseudo) legal move.
         move = None
-        while move not in hist[-1].gen_moves():
+        while move not in hist[-1].legal_moves():
             match = re.match('([a-i][0-9])'*2, input('Your move: '))
             if match:
-                move = parse(match.group(1)), parse(match.group(2))
+                move = make_move(parse(match.group(1)), parse(match.group(2)))
             else:
                 # Inform the user when invalid input (e.g. "help") is entered
                 print("Please enter a move like h2e2")
@@ -442,17 +1540,15 @@ def main():
             break
 
         # Fire up the engine to look for a move.
-        start = time.time()
-        for _depth, move, score in searcher.search(hist[-1], hist):
-            if time.time() - start > THINK_TIME:
-                break
+        for _depth, move, score, _stats in TimeManager(THINK_TIME).search(searcher, hist[-1], hist):
+            pass
 
         if score == MATE_UPPER:
             print("Checkmate!")
 
         # The black player moves from a rotated position, so we have to
         # 'back rotate' the move before printing it.
-        print("Think depth: {} My move: {}".format(_depth, render(255-move[0] - 1) + render(255-move[1]-1)))
+        print("Think depth: {} My move: {}".format(_depth, render(254 - (move >> 8)) + render(254 - (move & 255))))
         hist.append(hist[-1].move(move))
 
 if __name__ == '__main__':
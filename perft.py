@@ -0,0 +1,148 @@
+#!/usr/bin/env pypy
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+
+import elephantfish
+import tools
+
+################################################################################
+# Perft: counting the legal move sequences of a given length, to check move
+# generation against known numbers, and to time it.
+#
+# The counting runs on an elephantfish.Board with make/unmake, and at the last
+# ply only counts the legal moves instead of making them.
+################################################################################
+
+REFERENCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data/perft.txt')
+
+def perft(board, depth):
+    """ The number of legal move sequences of length depth from board """
+    if depth == 0:
+        return 1
+    if depth == 1:
+        return sum(1 for _ in board.legal_moves())
+    nodes = 0
+    for move in list(board.legal_moves()):
+        board.make(move)
+        nodes += perft(board, depth - 1)
+        board.unmake()
+    return nodes
+
+def hashed_perft(board, depth, table):
+    """ perft(), remembering the counts of positions by key and depth in the
+        dict table, so transpositions are only counted once """
+    if depth <= 1:
+        return perft(board, depth)
+    nodes = table.get((board.key, depth))
+    if nodes is None:
+        nodes = 0
+        for move in list(board.legal_moves()):
+            board.make(move)
+            nodes += hashed_perft(board, depth - 1, table)
+            board.unmake()
+        table[board.key, depth] = nodes
+    return nodes
+
+def count(pos, depth, hashed=False):
+    """ perft of a Position, counted on a Board """
+    if hashed:
+        return hashed_perft(elephantfish.Board(pos), depth, {})
+    return perft(elephantfish.Board(pos), depth)
+
+def count_after(args):
+    pos, move, depth, hashed = args
+    return count(pos.move(move), depth, hashed)
+
+def divide(pos, depth, processes=1, hashed=False):
+    """ The perft at depth - 1 after each legal move of pos, as a list of
+        (move, count). With processes > 1 (or None, for one per core) the root
+        moves are shared out to a pool of processes. """
+    moves = list(pos.legal_moves())
+    tasks = [(pos, move, depth - 1, hashed) for move in moves]
+    if processes == 1:
+        counts = list(map(count_after, tasks))
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            counts = pool.map(count_after, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    return list(zip(moves, counts))
+
+def parallel_perft(pos, depth, processes=None, hashed=False):
+    """ perft of pos, split across processes by root move """
+    if depth == 0:
+        return 1
+    return sum(n for _, n in divide(pos, depth, processes, hashed))
+
+def read_reference(path=REFERENCE):
+    """ The positions of a perft file, with lines 'fen;perft(1);perft(2);...',
+        as (fen, [counts]) """
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                parts = line.strip().split(';')
+                yield parts[0], [int(n) for n in parts[1:]]
+
+def run_suite(path=REFERENCE, depth=3, processes=1, hashed=False, verbose=True):
+    """ Checks the counts of every position in a perft file up to depth, and
+        prints the speed. Returns whether they all matched. """
+    ok, nodes, start = True, 0, time.time()
+    for fen, counts in read_reference(path):
+        pos = tools.parseFEN(fen)
+        for d, expected in enumerate(counts[:depth], 1):
+            if processes == 1:
+                res = count(pos, d, hashed)
+            else:
+                res = parallel_perft(pos, d, processes, hashed)
+            nodes += res
+            if res != expected:
+                ok = False
+                print('ERROR at depth {}: {} rather than {} for {}'.format(d, res, expected, fen))
+                print_divide(pos, d)
+                break
+        if verbose:
+            print(fen, counts[:depth])
+    if verbose:
+        secs = time.time() - start
+        print('{}, {:,} nodes in {:.2f}s: {:,.0f} nodes/s'.format(
+            'OK' if ok else 'FAILED', nodes, secs, nodes / max(secs, 1e-6)))
+    return ok
+
+def print_divide(pos, depth, processes=1, hashed=False):
+    total = 0
+    for move, n in divide(pos, depth, processes, hashed):
+        print('{}: {}'.format(tools.mrender(pos, move), n))
+        total += n
+    print('Total: {}'.format(total))
+
+def main():
+    parser = argparse.ArgumentParser(description='Perft for elephantfish')
+    parser.add_argument('--fen', help='count this position rather than the reference suite')
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--divide', action='store_true', help='print the count of every root move')
+    parser.add_argument('--hashed', action='store_true', help='count transpositions once')
+    parser.add_argument('--processes', type=int, default=1, help='split the root moves over processes, 0 for one per core')
+    parser.add_argument('--file', default=REFERENCE, help='perft file to check')
+    args = parser.parse_args()
+    processes = args.processes or None
+    if args.fen is None:
+        sys.exit(not run_suite(args.file, args.depth, processes, args.hashed))
+    pos = tools.parseFEN(args.fen)
+    start = time.time()
+    if args.divide:
+        print_divide(pos, args.depth, processes, args.hashed)
+    else:
+        print(parallel_perft(pos, args.depth, processes, args.hashed) if processes != 1
+              else count(pos, args.depth, args.hashed))
+    print('{:.2f}s'.format(time.time() - start))
+
+if __name__ == '__main__':
+    main()
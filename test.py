@@ -17,6 +17,8 @@ import unittest
 import warnings
 
 import elephantfish
+import algorithms
+import perft
 import tools
 
 ###############################################################################
@@ -32,7 +34,7 @@ def benchmark(cnt=20, depth=3):
         pos = tools.parseFEN(line)
         searcher = elephantfish.Searcher()
         start1 = time.time()
-        for search_depth, _, _ in searcher.search(pos):
+        for search_depth, _, _, _ in searcher.search(pos):
             speed = int(round(searcher.nodes/(time.time()-start1 + 1e-6)))
             print('Benchmark: {}/{}, Depth: {}, Speed: {:,}N/s'.format(
                 i+1, cnt, search_depth, speed), end='\r')
@@ -67,6 +69,8 @@ def selfplay(secs=1):
         pos = pos.move(m)
 
 def self_arena(version1, version2, games, secs, plus):
+    """ Plays games between two versions, each either the name of a search
+        strategy in algorithms.STRATEGIES or a module with a Searcher """
     print('Playing {} games of {} vs. {} at {} secs/game + {} secs/move'
             .format(games, version1, version2, secs, plus))
     openings_file = os.path.join(os.path.dirname(__file__), 'data/fen/random_openings.fen')
@@ -98,29 +102,27 @@ def self_arena(version1, version2, games, secs, plus):
 def play(version1_version2_secs_plus_fen):
     ''' returns 1 if fish1 won, 0 for draw and -1 otherwise '''
     version1, version2, secs, plus, fen = version1_version2_secs_plus_fen
-    modules = [importlib.import_module(version1), importlib.import_module(version2)]
     searchers = []
-    for module in modules:
+    for version in (version1, version2):
+        if version in algorithms.STRATEGIES:
+            searchers.append(algorithms.searcher(version))
+            continue
+        module = importlib.import_module(version)
         if hasattr(module, 'Searcher'):
             searchers.append(module.Searcher())
         else: searchers.append(module)
     times = [secs, secs]
-    efactor = [1, 1]
     pos = tools.parseFEN(fen)
     seen = set()
     for d in range(200):
-        moves_remain = 30
-        use = times[d%2]/moves_remain + plus
         # Use a bit more time, if we have more on the clock than our opponent
-        use += (times[d%2] - times[(d+1)%2])/10
-        use = max(use, plus)
+        timer = elephantfish.TimeManager.for_clock(times[d%2], plus, times[(d+1)%2])
         t = time.time()
-        m, score, depth = tools.search(searchers[d%2], pos, use*efactor[d%2])
-        efactor[d%2] *= (use/(time.time() - t + 1e-3))**.5
+        m, score, depth = tools.search(searchers[d%2], pos, timer)
         times[d%2] -= time.time() - t
         times[d%2] += plus
         #print('Used {:.2} rather than {:.2}. Off by {:.2}. Remaining: {}'
-            #.format(time.time()-t, use, (time.time()-t)/use, times[d%2]))
+            #.format(time.time()-t, timer.soft, (time.time()-t)/timer.soft, times[d%2]))
         if times[d%2] < 0:
             print('{} ran out of time'.format(version2 if d%2 == 1 else version1))
             return version1 if d%2 == 1 else version2
@@ -134,8 +136,7 @@ def play(version1_version2_secs_plus_fen):
             #assert False
 
         # Test move
-        is_dead = lambda pos: any(pos.value(m) >= elephantfish.MATE_LOWER for m in pos.gen_moves())
-        if is_dead(pos.move(m)):
+        if m not in list(pos.legal_moves()):
             name = version1 if d%2 == 0 else version2
             print('{} made an illegal move {} in position {}. Depth {}, Score {}'.
                     format(name, tools.mrender(pos,m), tools.renderFEN(pos), depth, score))
@@ -147,13 +148,13 @@ def play(version1_version2_secs_plus_fen):
 
         # Test repetition draws
         # This is by far the most common type of draw
-        if pos in seen:
+        if pos.key in seen:
             #print('Rep time at end', times)
             return None
-        seen.add(pos)
+        seen.add(pos.key)
 
-        any_moves = not all(is_dead(pos.move(m)) for m in pos.gen_moves())
-        in_check = is_dead(pos.nullmove())
+        any_moves = any(True for _ in pos.legal_moves())
+        in_check = pos.in_check()
         if not any_moves:
             if not in_check:
                 # This is actually a bit interesting. Why would we ever throw away a win like this?
@@ -176,9 +177,9 @@ def play(version1_version2_secs_plus_fen):
 # Perft test
 ###############################################################################
 
-def allperft(f, depth=4, verbose=True):
-    import gc
-    lines = f.readlines()
+def allperft(f=None, depth=4, verbose=True):
+    ''' Checks the counts in a perft file, by default data/perft.txt '''
+    lines = (f or open(perft.REFERENCE)).readlines()
     for d in range(1, depth+1):
         if verbose:
             print("Going to depth {}/{}".format(d, depth))
@@ -190,15 +191,13 @@ def allperft(f, depth=4, verbose=True):
                 print(parts[0])
 
             pos, score = tools.parseFEN(parts[0]), int(parts[d])
-            res = sum(1 for _ in tools.collect_tree_depth(tools.expand_position(pos), d))
+            res = perft.count(pos, d)
             if res != score:
                 print('=========================================')
                 print('ERROR at depth %d. Gave %d rather than %d' % (d, res, score))
                 print('=========================================')
                 print(tools.renderFEN(pos,0))
-                for move in pos.gen_moves():
-                    split = sum(1 for _ in tools.collect_tree_depth(tools.expand_position(pos.move(move)),1))
-                    print('{}: {}'.format(tools.mrender(pos, move), split))
+                perft.print_divide(pos, d)
                 return False
         if verbose:
             print('')
@@ -229,7 +228,7 @@ def main():
 
     benchmark(5,6)
 
-    self_arena("elephantfish", "algorithms.elephantfish_improve",100 , 20, .1)
+    self_arena("mtd-bi", "pvs", 100, 20, .1)
 
 # Old Python compatability
 if sys.version_info < (3,5):
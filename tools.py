@@ -1,6 +1,5 @@
 import itertools
 import re
-import time
 import sys
 
 import elephantfish
@@ -17,11 +16,12 @@ WHITE, BLACK = range(2)
 FEN_INITIAL = 'rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/9/RNBAKABNR w - - 0 1'
 
 def search(searcher, pos, secs, history=()):
-    """ This used to be in the Searcher class """
-    start = time.time()
-    for depth, move, score in searcher.search(pos, history):
-        if time.time() - start > secs:
-            break
+    """ This used to be in the Searcher class. secs is the time budget, or an
+        elephantfish.TimeManager. Searchers of the other versions yield
+        (depth, move, score) without the stats. """
+    timer = secs if isinstance(secs, elephantfish.TimeManager) else elephantfish.TimeManager(secs)
+    for result in timer.search(searcher, pos, history):
+        depth, move, score = result[:3]
     return move, score, depth
 
 
@@ -32,25 +32,23 @@ def search(searcher, pos, secs, history=()):
 def gen_legal_moves(pos):
     ''' pos.gen_moves(), but without those that leaves us in check.
         Also the position after moving is included. '''
-    for move in pos.gen_moves():
-        pos1 = pos.move(move)
-        if not can_kill_king(pos1):
-            yield move, pos1
+    for move in pos.legal_moves():
+        yield move, pos.move(move)
 
 def can_kill_king(pos):
-    # If we just checked for opponent moves capturing the king, we would miss
-    # captures in case of illegal castling.
-    return any(pos.value(m) >= elephantfish.MATE_LOWER for m in pos.gen_moves())
+    ''' Can the side to move capture the opponent's king? '''
+    king = pos.board.find('k')
+    return king < 0 or elephantfish.is_attacked(pos.board, king, lower=False)
 
 def mrender(pos, m):
     # Sunfish always assumes promotion to queen
-    p = 'q' if elephantfish.A9 <= m[1] <= elephantfish.I9 and pos.board[m[0]] == 'P' else ''
-    m = m if get_color(pos) == WHITE else (254-m[0], 254-m[1])
-    return elephantfish.render(m[0]) + elephantfish.render(m[1]) + p
+    p = 'q' if elephantfish.A9 <= m & 255 <= elephantfish.I9 and pos.board[m >> 8] == 'P' else ''
+    m = m if get_color(pos) == WHITE else elephantfish.flip_move(m)
+    return elephantfish.render(m >> 8) + elephantfish.render(m & 255) + p
 
 def mparse(color, move):
-    m = (elephantfish.parse(move[0:2]), elephantfish.parse(move[2:4]))
-    return m if color == WHITE else (254-m[0], 254-m[1])
+    m = elephantfish.make_move(elephantfish.parse(move[0:2]), elephantfish.parse(move[2:4]))
+    return m if color == WHITE else elephantfish.flip_move(m)
 
 ################################################################################
 # Parse and Render positions
@@ -71,7 +69,7 @@ def parseFEN(fen):
     board = ''.join(board)
     score = sum(elephantfish.pst[p][i] for i,p in enumerate(board) if p.isupper())
     score -= sum(elephantfish.pst[p.upper()][254-i] for i,p in enumerate(board) if p.islower())
-    pos = elephantfish.Position(board, score)
+    pos = elephantfish.make_position(board, score)
     return pos if color == 'w' else pos.rotate()
 
 def renderFEN(pos, half_move_clock=0, full_move_clock=1):
@@ -91,23 +89,23 @@ def renderFEN(pos, half_move_clock=0, full_move_clock=1):
 
 def pv(searcher, pos, include_scores=True, include_loop=False):
     res = []
-    seen_pos = set()
+    seen_keys = set()
     color = get_color(pos)
     origc = color
     if include_scores:
         res.append(str(pos.score))
     while True:
-        move = searcher.tp_move.get(pos)
+        move = searcher.tp.get_move(pos.key)
         # The tp may have illegal moves, given lower depths don't detect king killing
         if move is None or can_kill_king(pos.move(move)):
             break
         res.append(mrender(pos, move))
         pos, color = pos.move(move), 1-color
-        if pos in seen_pos:
+        if pos.key in seen_keys:
             if include_loop:
                 res.append('loop')
             break
-        seen_pos.add(pos)
+        seen_keys.add(pos.key)
         if include_scores:
             res.append(str(pos.score if color==origc else -pos.score))
     return ' '.join(res)
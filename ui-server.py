@@ -1,7 +1,8 @@
-import json, time, re
+import json, time, re, os
 from http.server import HTTPServer, SimpleHTTPRequestHandler
 
 import elephantfish
+import algorithms
 
 # Helper function to convert the 256-char board to a list of 10 rows (9 chars each)
 def convert_board_to_frontend_format(board_string_256):
@@ -138,8 +139,9 @@ def run_server(port=8000):
     print(f"Starting chess server on port {port}...")
     httpd.serve_forever()
 
-hist = [elephantfish.Position(elephantfish.initial, 0)]
-searcher = elephantfish.Searcher()
+hist = [elephantfish.make_position(elephantfish.initial, 0)]
+# The search strategy, by its name in algorithms.STRATEGIES
+searcher = algorithms.searcher(os.environ.get('ELEPHANTFISH_STRATEGY', algorithms.DEFAULT))
 
 def process_move(input_move):
     """
@@ -166,7 +168,7 @@ def process_move(input_move):
     match = re.match('([a-i][0-9])'*2, input_move)
     if not match:
         return ("Please enter a move like h2e2", 0, []) # Neutral score for input error
-    move = elephantfish.parse(match.group(1)), elephantfish.parse(match.group(2))
+    move = elephantfish.make_move(elephantfish.parse(match.group(1)), elephantfish.parse(match.group(2)))
     
     # gen_moves generates moves for the current player (which is Red/Player here, as hist[-1] is before player's move is applied and rotated)
     # So, hist[-1] here is from Player's perspective if we consider it *before* rotation for AI's turn.
@@ -194,7 +196,7 @@ def process_move(input_move):
     # The `hist[-1]` when `process_move` is called is the state *after* AI's last move, rotated, so it's Player's (Red's) turn. Score is from Red's view.
 
     player_pos = hist[-1] # Score is from Player's (Red's) perspective
-    if move not in player_pos.gen_moves(): # gen_moves() on player_pos should generate Red's moves
+    if move not in player_pos.legal_moves(): # legal_moves() on player_pos generates Red's moves
         return ("ErrInvalidMove", player_pos.score, []) # Return current player's score
 
     print(f"key log: input move is valid")
@@ -220,16 +222,16 @@ def process_move(input_move):
     # Fire up the engine to look for a move. AI's turn now.
     # searcher.search is on hist[-1] (AI's perspective)
     start = time.time()
-    ai_move_tuple = None
+    ai_move = None
     final_ai_score = 0 # This will be from AI's perspective
 
-    for _depth, current_ai_move_tuple, current_ai_score in searcher.search(hist[-1], hist):
-        ai_move_tuple = current_ai_move_tuple
+    # The time manager decides when to stop, keeping the last completed depth
+    timer = elephantfish.TimeManager(elephantfish.THINK_TIME)
+    for _depth, current_ai_move, current_ai_score, _stats in timer.search(searcher, hist[-1], hist):
+        ai_move = current_ai_move
         final_ai_score = current_ai_score
-        if time.time() - start > elephantfish.THINK_TIME:
-            break
     
-    if ai_move_tuple is None: # Should not happen if game is not over
+    if ai_move is None: # Should not happen if game is not over
         return ("AI Error: No move found", 0, [])
 
     # final_ai_score is from AI's perspective.
@@ -239,14 +241,14 @@ def process_move(input_move):
     
     # The black player moves from a rotated position, so we have to
     # 'back rotate' the move before printing it.
-    # The `ai_move_tuple` is already in the correct board representation (absolute indices).
+    # The `ai_move` is already in the correct board representation (absolute indices).
     # render() converts index to algebraic.
-    ai_move_str = elephantfish.render(ai_move_tuple[0]) + elephantfish.render(ai_move_tuple[1])
+    ai_move_str = elephantfish.render(ai_move >> 8) + elephantfish.render(ai_move & 255)
     
     # Store the score from AI's perspective along with its depth and move.
     print("Think depth: {} My move: {} AI_Score: {}".format(_depth, ai_move_str, final_ai_score))
     
-    hist.append(hist[-1].move(ai_move_tuple)) # new hist[-1] is now from Player's (Red's) perspective
+    hist.append(hist[-1].move(ai_move)) # new hist[-1] is now from Player's (Red's) perspective
 
     # The score to return to frontend should be from Player's perspective.
     # After AI moves and board is rotated (inside .move()), hist[-1].score is Player's score.